@@ -0,0 +1,400 @@
+"""
+Замеры производительности операций калькулятора Чёрча.
+
+Запуск: python benchmarks.py
+
+Набор для отслеживания регрессий прогоняет операции движка по нескольким
+размерам операндов, записывает время и пиковую память в JSON и сравнивает
+с сохранённой базовой линией:
+
+    python benchmarks.py --save     # записать базовую линию (до изменения)
+    python benchmarks.py --check    # сравнить; код возврата 1 при регрессии
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Tuple
+
+from church import ChurchCalculator, ChurchNumeral, factorial_cache
+from database import CalculationHistory
+from expression_parser import ExpressionParser
+
+
+def lambda_only(n: int) -> ChurchNumeral:
+    """Число, заданное только λ-термом (без кэшированного значения)."""
+    return ChurchNumeral(ChurchCalculator.from_int(n).numeral)
+
+
+def measure(func: Callable[[], Any], repeat: int = 3) -> float:
+    """Возвращает лучшее время выполнения func в секундах."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def lambda_to_int(n: ChurchNumeral) -> int:
+    """Вычисляет число применением его λ-терма, минуя кэш и дерево операций."""
+    return n.numeral(lambda x: x + 1)(0)
+
+
+def legacy_pred(n: ChurchNumeral) -> ChurchNumeral:
+    """Прежний предшественник со счётчиком: O(n²) на вычисление."""
+    if lambda_to_int(n) == 0:
+        return ChurchCalculator.zero()
+
+    def predecessor(f: Callable) -> Callable:
+        def inner(x: Any) -> Any:
+            counter = [0]
+            result = [x]
+
+            def wrapper(y: Any) -> Any:
+                counter[0] += 1
+                if counter[0] <= lambda_to_int(n) - 1:
+                    result[0] = f(y)
+                return result[0]
+
+            n(wrapper)(x)
+            return result[0]
+        return inner
+    return ChurchNumeral(predecessor)
+
+
+def legacy_subtract(m: ChurchNumeral, n: ChurchNumeral) -> ChurchNumeral:
+    """
+    Прежнее вычитание циклом pred с to_int на каждом шаге.
+    Каждый уровень pred заново вычисляет вложенное число, поэтому время
+    растёт быстрее любого многочлена — замеры только для малых k.
+    """
+    result = m
+    for _ in range(lambda_to_int(n)):
+        if lambda_to_int(result) > 0:
+            result = legacy_pred(result)
+        else:
+            break
+    return result
+
+
+def bench_subtract() -> None:
+    """Сравнение прежнего и парного вычитания на числах без кэша."""
+    print("Вычитание 2k - k (λ-термы без кэшированного значения)")
+    print(f"{'k':>8} {'прежнее, с':>14} {'по Клини, с':>14}")
+    for k in (2, 3, 4, 5):
+        m, n = lambda_only(2 * k), lambda_only(k)
+        old = measure(lambda: lambda_to_int(legacy_subtract(m, n)), repeat=1)
+        new = measure(lambda: lambda_to_int(ChurchCalculator.subtract(m, n)))
+        print(f"{k:>8} {old:>14.6f} {new:>14.6f}")
+    for k in (500, 5000, 50000):
+        m, n = lambda_only(2 * k), lambda_only(k)
+        new = measure(lambda: lambda_to_int(ChurchCalculator.subtract(m, n)))
+        print(f"{k:>8} {'-':>14} {new:>14.6f}")
+
+
+def bench_deep_chain() -> None:
+    """to_int для длинных цепочек succ/add над числом без значения."""
+    print("Цепочки succ/add над λ-термом (стековый вычислитель)")
+    print(f"{'длина':>8} {'to_int, с':>14}")
+    for length in (10 ** 4, 10 ** 5, 10 ** 6):
+        def run() -> int:
+            result = ChurchNumeral(lambda f: lambda x: f(x))
+            for i in range(length):
+                if i % 2:
+                    result = ChurchCalculator.succ(result)
+                else:
+                    result = ChurchCalculator.add(result, ChurchCalculator.one())
+            return result.to_int()
+        print(f"{length:>8} {measure(run, repeat=1):>14.6f}")
+
+
+def bench_divide() -> None:
+    """Деление: λ-вычитание через Z, быстрый путь по кэшу и нативное //."""
+    print("Деление a / b")
+    print(f"{'a':>8} {'b':>6} {'native, с':>12} {'divmod, с':>12} {'fast, с':>12}")
+    for a, b in ((10 ** 3, 7), (10 ** 5, 7), (10 ** 6, 10 ** 3), (10 ** 6, 7)):
+        m, n = ChurchCalculator.from_int(a), ChurchCalculator.from_int(b)
+        native = measure(lambda: a // b)
+        slow = measure(lambda: ChurchCalculator.divmod(m, n)[0].to_int(), repeat=1)
+        fast = measure(lambda: ChurchCalculator.divmod_fast(m, n)[0].to_int())
+        print(f"{a:>8} {b:>6} {native:>12.7f} {slow:>12.6f} {fast:>12.7f}")
+
+
+def legacy_parse_expression(expression: str) -> tuple:
+    """Прежний разбор: словарь шаблонов на каждый вызов и до шести re.match."""
+    expression = expression.strip().replace(' ', '').replace(',', '.')
+    patterns = {
+        'factorial': r'^([0-9]+\.?[0-9]*)!$',
+        'power': r'^([0-9]+\.?[0-9]*)\^([0-9]+\.?[0-9]*)$',
+        'multiply': r'^([0-9]+\.?[0-9]*)\*([0-9]+\.?[0-9]*)$',
+        'divide': r'^([0-9]+\.?[0-9]*)/([0-9]+\.?[0-9]*)$',
+        'add': r'^([0-9]+\.?[0-9]*)\+([0-9]+\.?[0-9]*)$',
+        'subtract': r'^([0-9]+\.?[0-9]*)-([0-9]+\.?[0-9]*)$'
+    }
+    for operation, pattern in patterns.items():
+        match = re.match(pattern, expression)
+        if match:
+            if operation == 'factorial':
+                return operation, float(match.group(1)), None
+            return operation, float(match.group(1)), float(match.group(2))
+    raise ValueError("Неподдерживаемое выражение или некорректный формат")
+
+
+def bench_parse(count: int = 20000) -> None:
+    """Пропускная способность разбора: выражений в секунду."""
+    print("Разбор выражений")
+    print(f"{'выражение':>20} {'прежний, 1/с':>14} {'Пратт, 1/с':>14}")
+    for expression in ("5+3", "12345*678", "20!", "(2+3)*4!^2", "((1+2)*(3+4))^2-5/2"):
+        try:
+            legacy_parse_expression(expression)
+            legacy = count / measure(lambda: [legacy_parse_expression(expression)
+                                              for _ in range(count)])
+            legacy = f"{legacy:>14.0f}"
+        except ValueError:
+            legacy = f"{'—':>14}"
+        pratt = count / measure(lambda: [ExpressionParser.parse(expression)
+                                         for _ in range(count)])
+        print(f"{expression:>20} {legacy} {pratt:>14.0f}")
+
+
+def legacy_save(db_path: str, expression: str, result: int, operation: str) -> bool:
+    """Прежняя запись: новое соединение без WAL на каждое сохранение."""
+    try:
+        conn = sqlite3.connect(db_path)
+        conn.execute('''
+            INSERT INTO calculations (expression, result, operation_type)
+            VALUES (?, ?, ?)
+        ''', (expression, str(result), operation))
+        conn.commit()
+        conn.close()
+        return True
+    except sqlite3.Error:
+        return False
+
+
+def concurrent_inserts(save: Callable[[str, int, str], bool],
+                       writers: int, per_writer: int) -> tuple:
+    """Запускает writers потоков по per_writer записей; (записей в секунду, ошибок)."""
+    failures = []
+
+    def writer(k: int) -> None:
+        failed = sum(not save(f"{k}+{i}", k + i, 'add') for i in range(per_writer))
+        failures.append(failed)
+
+    threads = [threading.Thread(target=writer, args=(k,)) for k in range(writers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return writers * per_writer / elapsed, sum(failures)
+
+
+def bench_inserts(writers: int = 16, per_writer: int = 200) -> None:
+    """Вставки в историю при параллельных писателях."""
+    print(f"Вставки в историю, {writers} писателей")
+    print(f"{'хранилище':>24} {'записей/с':>12} {'ошибок':>8}")
+    with tempfile.TemporaryDirectory() as directory:
+        legacy_path = os.path.join(directory, "legacy.db")
+        CalculationHistory(legacy_path).close()
+        conn = sqlite3.connect(legacy_path)
+        conn.execute('PRAGMA journal_mode=DELETE')
+        conn.close()
+        rate, failed = concurrent_inserts(
+            lambda *record: legacy_save(legacy_path, *record), writers, per_writer)
+        print(f"{'connect на запись':>24} {rate:>12.0f} {failed:>8}")
+
+        history = CalculationHistory(os.path.join(directory, "pooled.db"))
+        rate, failed = concurrent_inserts(history.save_calculation, writers, per_writer)
+        history.close()
+        print(f"{'пул, WAL':>24} {rate:>12.0f} {failed:>8}")
+
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks_baseline.json')
+
+# Допустимое замедление операции (среднее геометрическое по размерам)
+SLOWDOWN_TOLERANCE = 0.20
+
+# Допустимый рост показателя степени в зависимости времени от размера
+SLOPE_TOLERANCE = 0.25
+
+# Наименьшая длительность одной серии замера, секунды
+MIN_BATCH_TIME = 0.02
+
+
+def _fresh_factorial(n: int) -> int:
+    factorial_cache.clear()
+    return ChurchCalculator.factorial(ChurchCalculator.from_int(n)).to_int()
+
+
+# Операция: размеры операндов и вычисление для размера. Числа без значения
+# задаются λ-термами, чтобы замерять работу движка, а не замкнутые формулы.
+SUITE: Dict[str, Tuple[Tuple[int, ...], Callable[[int], Any]]] = {
+    'from_int': ((10 ** 3, 10 ** 4, 10 ** 5, 10 ** 6), ChurchCalculator.from_int),
+    'to_int': ((10 ** 3, 10 ** 4, 10 ** 5), lambda n: lambda_only(n).to_int()),
+    'pred': ((10 ** 2, 10 ** 3, 10 ** 4),
+             lambda n: lambda_to_int(ChurchCalculator.pred(lambda_only(n)))),
+    'subtract': ((10 ** 2, 10 ** 3, 10 ** 4),
+                 lambda n: lambda_to_int(ChurchCalculator.subtract(lambda_only(2 * n), lambda_only(n)))),
+    'multiply': ((100, 300, 1000),
+                 lambda n: lambda_to_int(ChurchCalculator.multiply(lambda_only(n), lambda_only(n)))),
+    # Размер степени — её результат 2^k
+    'power': ((2 ** 8, 2 ** 12, 2 ** 16),
+              lambda n: lambda_to_int(ChurchCalculator.power(lambda_only(2), lambda_only(n.bit_length() - 1)))),
+    'factorial': ((250, 500, 1000, 2000), _fresh_factorial),
+}
+
+
+def time_call(func: Callable[[], Any], repeat: int = 5) -> float:
+    """Лучшее время одного вызова по repeat сериям не короче MIN_BATCH_TIME."""
+    number = 1
+    while True:
+        elapsed = measure(lambda: [func() for _ in range(number)], repeat=1)
+        if elapsed >= MIN_BATCH_TIME:
+            break
+        number *= 2
+    best = min(elapsed, measure(lambda: [func() for _ in range(number)], repeat=repeat - 1))
+    return best / number
+
+
+def peak_memory(func: Callable[[], Any]) -> int:
+    """Пиковый объём памяти, выделенной за один вызов, байты."""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def slope(sizes: List[int], seconds: List[float]) -> float:
+    """Показатель степени k в time ∝ sizeᵏ по методу наименьших квадратов в log-log."""
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(t, 1e-12)) for t in seconds]
+    mean_x, mean_y = sum(xs) / len(xs), sum(ys) / len(ys)
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var_x
+
+
+def run_suite(operations: Tuple[str, ...] = tuple(SUITE)) -> Dict[str, Dict[str, Any]]:
+    """Замеряет операции по всем размерам: время, пиковая память, наклон."""
+    results = {}
+    for operation in operations:
+        sizes, run = SUITE[operation]
+        seconds = [time_call(lambda: run(size)) for size in sizes]
+        memory = [peak_memory(lambda: run(size)) for size in sizes]
+        results[operation] = {
+            'sizes': list(sizes),
+            'seconds': seconds,
+            'peak_bytes': memory,
+            'slope': slope(list(sizes), seconds),
+        }
+    return results
+
+
+def compare(baseline: Dict[str, Dict[str, Any]],
+            current: Dict[str, Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """Регрессии (операция, описание) относительно базовой линии."""
+    regressions = []
+    for operation, now in current.items():
+        before = baseline.get(operation)
+        if before is None or before['sizes'] != now['sizes']:
+            continue
+        ratios = [new / old for new, old in zip(now['seconds'], before['seconds'])]
+        slowdown = math.exp(sum(math.log(r) for r in ratios) / len(ratios))
+        if slowdown > 1 + SLOWDOWN_TOLERANCE:
+            regressions.append((operation, f"медленнее в {slowdown:.2f} раза"))
+        if now['slope'] > before['slope'] + SLOPE_TOLERANCE:
+            regressions.append((operation, f"рост O(n^{before['slope']:.2f}) → "
+                                            f"O(n^{now['slope']:.2f})"))
+    return regressions
+
+
+def print_suite(results: Dict[str, Dict[str, Any]],
+                baseline: Dict[str, Dict[str, Any]] = None) -> None:
+    print(f"{'операция':>10} {'размер':>8} {'время, с':>12} {'база, с':>12} {'память, КБ':>11}")
+    for operation, result in results.items():
+        before = (baseline or {}).get(operation)
+        for i, size in enumerate(result['sizes']):
+            base = f"{before['seconds'][i]:>12.3e}" if before and before['sizes'] == result['sizes'] else f"{'—':>12}"
+            print(f"{operation:>10} {size:>8} {result['seconds'][i]:>12.3e} {base} "
+                  f"{result['peak_bytes'][i] / 1024:>11.1f}")
+        print(f"{operation:>10} {'наклон':>8} {result['slope']:>12.2f}")
+
+
+def save_baseline(results: Dict[str, Dict[str, Any]], path: str = BASELINE_PATH) -> None:
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'machine': platform.platform(),
+            'results': results,
+        }, f, ensure_ascii=False, indent=2)
+
+
+def load_baseline(path: str = BASELINE_PATH) -> Dict[str, Dict[str, Any]]:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)['results']
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Замеры производительности калькулятора Чёрча")
+    parser.add_argument('--save', action='store_true', help="записать базовую линию")
+    parser.add_argument('--check', action='store_true', help="сравнить с базовой линией")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--operations', nargs='+', choices=list(SUITE), default=list(SUITE))
+    args = parser.parse_args()
+
+    if not (args.save or args.check):
+        bench_subtract()
+        print()
+        bench_deep_chain()
+        print()
+        bench_divide()
+        print()
+        bench_parse()
+        print()
+        bench_inserts()
+        return 0
+
+    results = run_suite(tuple(args.operations))
+    if args.save:
+        print_suite(results)
+        save_baseline(results, args.baseline)
+        print(f"Базовая линия записана: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"Нет базовой линии {args.baseline}: запустите с --save до изменения")
+        return 2
+    baseline = load_baseline(args.baseline)
+    regressions = compare(baseline, results)
+    if regressions:
+        # Повторный замер отсеивает случайные замедления: берётся лучшее из двух
+        suspects = tuple(dict.fromkeys(operation for operation, _ in regressions))
+        for operation, result in run_suite(suspects).items():
+            seconds = [min(a, b) for a, b in zip(results[operation]['seconds'], result['seconds'])]
+            results[operation].update(seconds=seconds, slope=slope(result['sizes'], seconds))
+        regressions = compare(baseline, results)
+    print_suite(results, baseline)
+    for operation, description in regressions:
+        print(f"РЕГРЕССИЯ {operation}: {description}")
+    if not regressions:
+        print("Регрессий нет")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
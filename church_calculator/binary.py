@@ -0,0 +1,184 @@
+"""
+Двоичное кодирование натуральных чисел в λ-исчислении.
+
+Число хранится как список церковных булевых значений (младший бит первым),
+поэтому размер представления и стоимость операций растут с длиной числа
+в битах, а не с его величиной. Это отдельный движок, калькулятор
+по умолчанию его не использует: числа Чёрча хранят целое значение, и
+операции над ним быстрее арифметики по битам на церковных булевых.
+"""
+
+from typing import Callable, Iterable, Tuple
+
+from church import ChurchCalculator, ChurchNumeral, FALSE, TRUE
+
+
+# Операции над церковными булевыми значениями.
+NOT: Callable = lambda p: p(FALSE)(TRUE)
+AND: Callable = lambda p: lambda q: p(q)(p)
+OR: Callable = lambda p: lambda q: p(p)(q)
+XOR: Callable = lambda p: lambda q: p(NOT(q))(q)
+
+
+def church_bool(value: bool) -> Callable:
+    return TRUE if value else FALSE
+
+
+def to_bool(p: Callable) -> bool:
+    return p(True)(False)
+
+
+class BinaryNumeral:
+    """
+    Двоичное число: кортеж церковных булевых значений, младший бит первым.
+    Старшие нулевые биты не хранятся, ноль — пустой кортеж.
+    """
+
+    __slots__ = ('bits',)
+
+    def __init__(self, bits: Iterable[Callable] = ()) -> None:
+        bits = list(bits)
+        while bits and not to_bool(bits[-1]):
+            bits.pop()
+        self.bits: Tuple[Callable, ...] = tuple(bits)
+
+    def __len__(self) -> int:
+        return len(self.bits)
+
+    def __str__(self) -> str:
+        return str(self.to_int())
+
+    def bit(self, i: int) -> Callable:
+        return self.bits[i] if i < len(self.bits) else FALSE
+
+    def to_int(self) -> int:
+        return sum(bit(1 << i)(0) for i, bit in enumerate(self.bits))
+
+
+class BinaryCalculator:
+    """
+    Арифметика над двоичными λ-числами. Все решения принимаются
+    церковными булевыми значениями, без сравнения Python-чисел.
+    """
+
+    @staticmethod
+    def zero() -> BinaryNumeral:
+        return BinaryNumeral()
+
+    @staticmethod
+    def from_int(n: int) -> BinaryNumeral:
+        if n < 0:
+            raise ValueError("Church numerals can only represent non-negative integers")
+        return BinaryNumeral(church_bool(n >> i & 1) for i in range(n.bit_length()))
+
+    @staticmethod
+    def from_church(n: ChurchNumeral) -> BinaryNumeral:
+        return BinaryCalculator.from_int(n.to_int())
+
+    @staticmethod
+    def to_church(n: BinaryNumeral) -> ChurchNumeral:
+        return ChurchCalculator.from_int(n.to_int())
+
+    @staticmethod
+    def shift(n: BinaryNumeral, k: int = 1) -> BinaryNumeral:
+        """Умножение на 2^k сдвигом."""
+        if not n.bits:
+            return n
+        return BinaryNumeral((FALSE,) * k + n.bits)
+
+    @staticmethod
+    def add(m: BinaryNumeral, n: BinaryNumeral) -> BinaryNumeral:
+        """Сложение полным сумматором с переносом."""
+        bits = []
+        carry = FALSE
+        for i in range(max(len(m), len(n))):
+            x, y = m.bit(i), n.bit(i)
+            half = XOR(x)(y)
+            bits.append(XOR(half)(carry))
+            carry = OR(AND(x)(y))(AND(carry)(half))
+        bits.append(carry)
+        return BinaryNumeral(bits)
+
+    @staticmethod
+    def less(m: BinaryNumeral, n: BinaryNumeral) -> Callable:
+        """m < n как церковное булево значение."""
+        result = FALSE
+        for i in range(max(len(m), len(n))):
+            x, y = m.bit(i), n.bit(i)
+            # Старший различающийся бит определяет результат.
+            result = XOR(x)(y)(y)(result)
+        return result
+
+    @staticmethod
+    def equal(m: BinaryNumeral, n: BinaryNumeral) -> Callable:
+        result = TRUE
+        for i in range(max(len(m), len(n))):
+            result = AND(result)(NOT(XOR(m.bit(i))(n.bit(i))))
+        return result
+
+    @staticmethod
+    def compare(m: BinaryNumeral, n: BinaryNumeral) -> int:
+        """-1, 0 или 1 в зависимости от порядка m и n."""
+        if to_bool(BinaryCalculator.less(m, n)):
+            return -1
+        return 0 if to_bool(BinaryCalculator.equal(m, n)) else 1
+
+    @staticmethod
+    def subtract(m: BinaryNumeral, n: BinaryNumeral) -> BinaryNumeral:
+        """Усечённое вычитание: при m < n результат 0."""
+        bits = []
+        borrow = FALSE
+        for i in range(max(len(m), len(n))):
+            x, y = m.bit(i), n.bit(i)
+            half = XOR(x)(y)
+            bits.append(XOR(half)(borrow))
+            borrow = OR(AND(NOT(x))(y))(AND(NOT(half))(borrow))
+        return borrow(BinaryNumeral())(BinaryNumeral(bits))
+
+    @staticmethod
+    def multiply(m: BinaryNumeral, n: BinaryNumeral) -> BinaryNumeral:
+        """Умножение сдвигами и сложениями."""
+        result = BinaryNumeral()
+        for i, bit in enumerate(n.bits):
+            result = bit(BinaryCalculator.add(result, BinaryCalculator.shift(m, i)))(result)
+        return result
+
+    @staticmethod
+    def divmod(m: BinaryNumeral, n: BinaryNumeral) -> Tuple[BinaryNumeral, BinaryNumeral]:
+        """Деление столбиком: частное и остаток."""
+        if not n.bits:
+            raise ValueError("Деление на ноль")
+        quotient = []
+        remainder = BinaryNumeral()
+        for bit in reversed(m.bits):
+            remainder = BinaryNumeral((bit,) + remainder.bits)
+            fits = NOT(BinaryCalculator.less(remainder, n))
+            quotient.append(fits)
+            remainder = fits(BinaryCalculator.subtract(remainder, n))(remainder)
+        return BinaryNumeral(reversed(quotient)), remainder
+
+    @staticmethod
+    def power(m: BinaryNumeral, n: BinaryNumeral) -> BinaryNumeral:
+        """Возведение в степень повторным возведением в квадрат."""
+        result = BinaryCalculator.from_int(1)
+        base = m
+        for i, bit in enumerate(n.bits):
+            result = bit(BinaryCalculator.multiply(result, base))(result)
+            if i + 1 < len(n.bits):
+                base = BinaryCalculator.multiply(base, base)
+        return result
+
+    @staticmethod
+    def calculate(operation: str, a: int, b: int) -> int:
+        """Вычисляет результат операции парсера над целыми операндами."""
+        m, n = BinaryCalculator.from_int(a), BinaryCalculator.from_int(b)
+        return _OPERATIONS[operation](m, n).to_int()
+
+
+_OPERATIONS = {
+    'add': BinaryCalculator.add,
+    'subtract': BinaryCalculator.subtract,
+    'multiply': BinaryCalculator.multiply,
+    'divide': lambda m, n: BinaryCalculator.divmod(m, n)[0],
+    'power': BinaryCalculator.power,
+}
@@ -0,0 +1,391 @@
+"""
+Общий конвейер вычислений калькулятора Чёрча.
+
+Разбор, оценка стоимости и вычисление выражения вынесены сюда из веб-версии
+и графического интерфейса. Перед конвейером стоит ограниченный LRU-кэш
+результатов по нормализованному тексту выражения, за ним — таблица
+calculations в SQLite, из которой кэш заполняется при запуске.
+"""
+
+import math
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, TimeoutError, wait
+from typing import Any, Dict, List, NamedTuple, Optional, Protocol, Sequence, Tuple, Union
+
+from church import ChurchCalculator
+from cost import (ACCEPT, MAX_RESULT_BITS, CostBudget, CostEstimate, TooExpensiveError,
+                  estimate, estimate_tree)
+from executor import CalculationCancelled, ChurchExecutor
+from expression_parser import ExpressionParser, normalize
+from metrics import ERRORS, EVALUATE_SECONDS, PARSE_SECONDS, REJECTED
+from symbolic import OPERATIONS, Expr, Num, Term, walk
+
+
+SUBTRACT_WARNING = "Внимание: уменьшаемое меньше вычитаемого. Ответ 0."
+
+# Допустимые результаты переводятся в текст и обратно для истории и ответа
+if hasattr(sys, 'set_int_max_str_digits'):
+    sys.set_int_max_str_digits(max(sys.get_int_max_str_digits(),
+                                   math.ceil(MAX_RESULT_BITS * math.log10(2)) + 1))
+
+
+def _batch_timeout(timeout: float) -> TooExpensiveError:
+    return TooExpensiveError(f"Вычисление слишком дорогое: пакет не уложился в {timeout:g} с")
+
+
+class Calculation(NamedTuple):
+    """Результат вычисления выражения."""
+    expression: str
+    operation: str
+    result: int
+    warning: Optional[str] = None
+
+
+class ExpressionCache:
+    """
+    Ограниченная по размеру LRU-таблица вычисленных выражений
+    с счётчиками попаданий, промахов и вытеснений.
+    """
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._table: "OrderedDict[str, Calculation]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, expression: str) -> Optional[Calculation]:
+        with self._lock:
+            cached = self._table.get(expression)
+            if cached is None:
+                self.misses += 1
+                return None
+            self._table.move_to_end(expression)
+            self.hits += 1
+            return cached
+
+    def put(self, calculation: Calculation) -> None:
+        with self._lock:
+            self._table[calculation.expression] = calculation
+            self._table.move_to_end(calculation.expression)
+            while len(self._table) > self.maxsize:
+                self._table.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._table.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'size': len(self._table),
+                'maxsize': self.maxsize,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+
+expression_cache = ExpressionCache()
+
+
+class ResultStore(Protocol):
+    """Хранилище сохранённых вычислений, например CalculationHistory."""
+
+    def find_result(self, expression: str, operation_type: str) -> Optional[str]: ...
+
+    def most_frequent(self, limit: int = 200) -> List[Tuple[str, str, str]]: ...
+
+
+class CalculationPipeline:
+    """Разбор и вычисление выражения с кэшем результатов."""
+
+    def __init__(self, cost_budget: Optional[CostBudget] = None,
+                 executor: Optional[ChurchExecutor] = None,
+                 cache: Optional[ExpressionCache] = None,
+                 store: Optional[ResultStore] = None) -> None:
+        self.cost_budget = cost_budget or CostBudget()
+        self.executor = executor or ChurchExecutor(
+            inline_bits=self.cost_budget.inline_result_bits)
+        self.cache = expression_cache if cache is None else cache
+        self.store = store
+        self.store_hits = 0
+
+    def calculate(self, expression: str,
+                  cancel: Optional[threading.Event] = None) -> Calculation:
+        """
+        Возвращает результат выражения. Ошибки разбора и отклонённые
+        выражения не кэшируются. Установленный флаг cancel прерывает
+        вычисление с CalculationCancelled.
+        """
+        key = normalize(expression)
+        found = self._lookup(key)
+        if isinstance(found, Calculation):
+            return found
+        return self._run(key, found, cancel)
+
+    def calculate_many(self, expressions: Sequence[str], pool: Executor,
+                       timeout: float) -> List[Union[Calculation, Exception]]:
+        """
+        Вычисляет пакет выражений с общим сроком timeout секунд.
+
+        Все выражения разбираются заранее, одинаковые считаются один раз.
+        Дешёвые вычисляются по уровням деревьев через
+        ChurchCalculator.evaluate_many, поэтому общие подвыражения разных
+        выражений пакета считаются один раз. Тяжёлые уходят в pool, а из него
+        в отдельные процессы. Не уложившиеся в срок выражения получают
+        TooExpensiveError. Для каждого входного выражения возвращается
+        результат или ошибка.
+        """
+        deadline = time.monotonic() + timeout
+        keys = [normalize(expression) for expression in expressions]
+        results: Dict[str, Union[Calculation, Exception]] = {}
+        cheap: Dict[str, Expr] = {}
+        heavy: Dict[str, Expr] = {}
+        for key in dict.fromkeys(keys):
+            try:
+                found = self._lookup(key)
+                if isinstance(found, Calculation):
+                    results[key] = found
+                elif self._admit(found) == ACCEPT:
+                    cheap[key] = found
+                else:
+                    heavy[key] = found
+            except Exception as e:
+                results[key] = e
+
+        cancel = threading.Event()
+        futures = {key: pool.submit(self._run, key, tree, cancel) for key, tree in heavy.items()}
+        results.update(self._evaluate_levels(cheap, pool, deadline, timeout))
+        wait(futures.values(), timeout=max(deadline - time.monotonic(), 0))
+        # Оставшиеся тяжёлые вычисления останавливаются вместе с их процессами
+        cancel.set()
+        for key, future in futures.items():
+            error = future.exception() if future.done() else None
+            if not future.done() or isinstance(error, CalculationCancelled):
+                future.cancel()
+                REJECTED.inc()
+                results[key] = _batch_timeout(timeout)
+            else:
+                results[key] = error or future.result()
+        return [results[key] for key in keys]
+
+    @staticmethod
+    def estimate(expression: str) -> CostEstimate:
+        """Оценка числа применений f для выражения без его вычисления."""
+        tree = ExpressionParser.parse(normalize(expression))
+        parsed = ExpressionParser.as_tuple(tree)
+        if parsed is None:
+            return estimate_tree(tree)
+        return estimate(*parsed)
+
+    def warm(self, limit: int = 200) -> int:
+        """Заполняет кэш самыми частыми выражениями из хранилища."""
+        if self.store is None:
+            return 0
+        loaded = 0
+        for expression, operation, result in reversed(self.store.most_frequent(limit)):
+            try:
+                expression = normalize(expression)
+                tree = ExpressionParser.parse(expression)
+                calculation = self._from_store(expression, tree, result)
+            except ValueError:
+                continue
+            if calculation.operation == operation:
+                self.cache.put(calculation)
+                loaded += 1
+        return loaded
+
+    def stats(self) -> Dict[str, int]:
+        return dict(self.cache.stats(), store_hits=self.store_hits)
+
+    def _lookup(self, expression: str) -> Union[Calculation, Expr]:
+        """Результат из кэша или хранилища, иначе дерево разбора для вычисления."""
+        cached = self.cache.get(expression)
+        if cached is not None:
+            return cached
+        try:
+            with PARSE_SECONDS.time():
+                tree = ExpressionParser.parse(expression)
+        except ValueError:
+            ERRORS.inc('parse')
+            raise
+        calculation = self._load(expression, tree)
+        if calculation is None:
+            return tree
+        self.cache.put(calculation)
+        return calculation
+
+    def _run(self, expression: str, tree: Expr,
+             cancel: Optional[threading.Event] = None) -> Calculation:
+        if cancel is not None and cancel.is_set():
+            raise CalculationCancelled("Вычисление отменено")
+        start = time.perf_counter()
+        try:
+            calculation = self._evaluate(expression, tree, cancel)
+        except TooExpensiveError:
+            REJECTED.inc()
+            raise
+        except CalculationCancelled:
+            raise
+        except Exception:
+            ERRORS.inc('evaluate')
+            raise
+        EVALUATE_SECONDS.observe(time.perf_counter() - start, calculation.operation)
+        self.cache.put(calculation)
+        return calculation
+
+    def _admit(self, tree: Expr) -> str:
+        """Решение бюджета для дерева разбора; отказ выбрасывает TooExpensiveError."""
+        parsed = ExpressionParser.as_tuple(tree)
+        try:
+            if parsed is None:
+                return self.cost_budget.check_tree(tree)
+            return self.cost_budget.check(*parsed)
+        except TooExpensiveError:
+            REJECTED.inc()
+            raise
+
+    def _evaluate_levels(self, trees: Dict[str, Expr], pool: Executor, deadline: float,
+                         timeout: float) -> Dict[str, Union[Calculation, Exception]]:
+        """
+        Вычисляет дешёвые деревья пакета уровень за уровнем: все узлы одной
+        глубины всех деревьев передаются одним вызовом evaluate_many.
+        """
+        results: Dict[str, Union[Calculation, Exception]] = {}
+        plans: Dict[str, List[List[Any]]] = {}
+        for key, tree in trees.items():
+            try:
+                plans[key] = self._plan(tree)
+            except Exception as e:
+                ERRORS.inc('evaluate')
+                results[key] = e
+
+        level = 1
+        while plans:
+            steps: Dict[Tuple[str, int], Tuple[str, Any, Any]] = {}
+            for key, plan in list(plans.items()):
+                for index, entry in enumerate(plan):
+                    node, operands, depth = entry
+                    if depth != level:
+                        continue
+                    values = [plan[i][1] for i in operands]
+                    operation = OPERATIONS.get(type(node))
+                    if operation is None:
+                        # Узлы без операции ChurchCalculator (Succ, Pred)
+                        entry[1] = node.compute(*values)
+                    else:
+                        steps[key, index] = (operation, values[0], values[1] if len(values) > 1 else None)
+            remaining = deadline - time.monotonic()
+            if steps and remaining <= 0:
+                values = [TimeoutError()] * len(steps)
+            else:
+                values = ChurchCalculator.evaluate_many(list(steps.values()), return_exceptions=True,
+                                                        pool=pool, timeout=remaining)
+            for (key, index), value in zip(steps, values):
+                if key not in plans:
+                    continue
+                if isinstance(value, TimeoutError):
+                    REJECTED.inc()
+                    results[key] = _batch_timeout(timeout)
+                    del plans[key]
+                elif isinstance(value, Exception):
+                    ERRORS.inc('evaluate')
+                    results[key] = value
+                    del plans[key]
+                else:
+                    plans[key][index][1] = value.to_int()
+            for key, plan in list(plans.items()):
+                if plan[-1][2] == level:
+                    calculation = self._from_store(key, trees[key], plan[-1][1])
+                    self.cache.put(calculation)
+                    results[key] = calculation
+                    del plans[key]
+            level += 1
+        return results
+
+    @staticmethod
+    def _plan(tree: Expr) -> List[List[Any]]:
+        """
+        Узлы дерева в обратном порядке как [узел, значение или номера
+        операндов, глубина]; у листьев глубина 0. Для выражения из одной
+        операции операнды берутся целыми, как в _evaluate.
+        """
+        parsed = ExpressionParser.as_tuple(tree)
+        if parsed is not None:
+            if parsed[0] == 'factorial' and parsed[1] != int(parsed[1]):
+                raise ValueError("Факториал определен только для целых чисел")
+            leaves = [[None, int(value), 0] for value in parsed[1:] if value is not None]
+            return leaves + [[tree, list(range(len(leaves))), 1]]
+
+        plan: List[List[Any]] = []
+
+        def visit(node: Expr, operands: Tuple[int, ...]) -> int:
+            if isinstance(node, Num):
+                plan.append([node, node.value, 0])
+            elif isinstance(node, Term):
+                plan.append([node, node.numeral.to_int(), 0])
+            else:
+                plan.append([node, list(operands), 1 + max(plan[i][2] for i in operands)])
+            return len(plan) - 1
+
+        walk(tree, visit)
+        return plan
+
+    def _load(self, expression: str, tree: Expr) -> Optional[Calculation]:
+        """Результат из хранилища, если выражение уже вычислялось."""
+        if self.store is None:
+            return None
+        result = self.store.find_result(expression, ExpressionParser.operation(tree))
+        if result is None:
+            return None
+        try:
+            calculation = self._from_store(expression, tree, result)
+        except ValueError:
+            return None
+        self.store_hits += 1
+        return calculation
+
+    @staticmethod
+    def _from_store(expression: str, tree: Expr, result: Union[str, int]) -> Calculation:
+        parsed = ExpressionParser.as_tuple(tree)
+        warning = None
+        if parsed is not None and parsed[0] == 'subtract' and int(parsed[1]) < int(parsed[2]):
+            warning = SUBTRACT_WARNING
+        return Calculation(expression, ExpressionParser.operation(tree), int(result), warning)
+
+    def _evaluate(self, expression: str, tree: Expr,
+                  cancel: Optional[threading.Event] = None) -> Calculation:
+        parsed = ExpressionParser.as_tuple(tree)
+        operation = ExpressionParser.operation(tree)
+
+        # Слишком дорогие выражения отклоняются до вычисления
+        if parsed is None:
+            self.cost_budget.check_tree(tree)
+            # Вложенное выражение вычисляется по дереву разбора
+            return Calculation(expression, operation, self.executor.run_tree(tree, cancel))
+
+        self.cost_budget.check(*parsed)
+        if operation == 'factorial':
+            n = parsed[1]
+            if n != int(n):
+                raise ValueError("Факториал определен только для целых чисел")
+            # Тяжёлые факториалы считаются в отдельном процессе
+            return Calculation(expression, operation, self.executor.run('factorial', int(n), cancel=cancel))
+
+        # Для церковных чисел - только целые части
+        int_a, int_b = int(parsed[1]), int(parsed[2])
+
+        if operation == 'subtract' and int_a < int_b:
+            return Calculation(expression, operation, 0, SUBTRACT_WARNING)
+        # Тяжёлые степени считаются в отдельном процессе
+        return Calculation(expression, operation, self.executor.run(operation, int_a, int_b, cancel=cancel))
@@ -2,25 +2,294 @@
 Модуль реализует кодирование Чёрча для представления натуральных чисел и арифметических операций в рамках λ-исчисления
 """
 
-from typing import Callable, Any
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor, TimeoutError, wait
+from contextlib import contextmanager
+from typing import Callable, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+class Instrumentation:
+    """
+    Счётчики работы λ-движка внутри instrument():
+    applications — применения функции-аргумента числами,
+    closures — созданные λ-термы и замыкания движка,
+    max_depth — наибольшая вложенность применений и дерева операций,
+    shortcuts — операции, выполненные по известным значениям без применения f.
+    sections — те же счётчики по операциям evaluate и вызовам to_int.
+    """
+    
+    __slots__ = ('applications', 'closures', 'max_depth', 'shortcuts', 'depth', 'sections')
+    
+    def __init__(self) -> None:
+        self.applications = 0
+        self.closures = 0
+        self.max_depth = 0
+        self.shortcuts = 0
+        self.depth = 0
+        self.sections: Dict[str, Dict[str, int]] = {}
+    
+    def enter(self, depth: int = 1) -> None:
+        self.depth += depth
+        if self.depth > self.max_depth:
+            self.max_depth = self.depth
+    
+    @contextmanager
+    def section(self, name: str) -> Iterator[None]:
+        """Добавляет прирост счётчиков за время блока к sections[name]."""
+        before = (self.applications, self.closures, self.shortcuts)
+        try:
+            yield
+        finally:
+            totals = self.sections.setdefault(
+                name, {'calls': 0, 'applications': 0, 'closures': 0, 'shortcuts': 0})
+            totals['calls'] += 1
+            totals['applications'] += self.applications - before[0]
+            totals['closures'] += self.closures - before[1]
+            totals['shortcuts'] += self.shortcuts - before[2]
+    
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'applications': self.applications,
+            'closures': self.closures,
+            'max_depth': self.max_depth,
+            'shortcuts': self.shortcuts,
+            'sections': {name: dict(totals) for name, totals in self.sections.items()},
+        }
+
+
+_instrumentation = threading.local()
+# Число активных instrument() во всех потоках; при нуле счёт не ведётся
+_instrumented = 0
+_instrumented_lock = threading.Lock()
+
+
+def _current() -> Optional[Instrumentation]:
+    if not _instrumented:
+        return None
+    return getattr(_instrumentation, 'stats', None)
+
+
+@contextmanager
+def instrument() -> Iterator[Instrumentation]:
+    """
+    Включает подсчёт работы движка в текущем потоке. Операции, вычисленные
+    в других потоках или процессах, не учитываются.
+    """
+    global _instrumented
+    stats = Instrumentation()
+    outer = getattr(_instrumentation, 'stats', None)
+    _instrumentation.stats = stats
+    with _instrumented_lock:
+        _instrumented += 1
+    try:
+        yield stats
+    finally:
+        with _instrumented_lock:
+            _instrumented -= 1
+        _instrumentation.stats = outer
+        if outer is not None:
+            outer.applications += stats.applications
+            outer.closures += stats.closures
+            outer.shortcuts += stats.shortcuts
+            outer.max_depth = max(outer.max_depth, outer.depth + stats.max_depth)
+
+
+def _count_closure() -> None:
+    stats = _current()
+    if stats is not None:
+        stats.closures += 1
+
+
+def _applied(numeral: Callable[[Callable], Callable], f: Callable) -> Callable:
+    """numeral(f); внутри instrument() считает применения f и их вложенность."""
+    stats = _current()
+    if stats is None:
+        return numeral(f)
+    
+    def counted(x: Any) -> Any:
+        stats.applications += 1
+        return f(x)
+    
+    inner = numeral(counted)
+    
+    def apply(x: Any) -> Any:
+        stats.enter()
+        try:
+            return inner(x)
+        finally:
+            stats.depth -= 1
+    return apply
+
+
+def _iterate(n: int) -> Callable[[Callable], Callable]:
+    """Строит λf.λx.fⁿ(x) циклом, без вложенных замыканий."""
+    if _instrumented:
+        _count_closure()
+    
+    def numeral(f: Callable) -> Callable:
+        if _instrumented:
+            _count_closure()
+        
+        def apply(x: Any) -> Any:
+            for _ in range(n):
+                x = f(x)
+            return x
+        return apply
+    return numeral
 
 
 class ChurchNumeral:
     """
     Класс, представляющий церковные числа.
+
+    Помимо λ-терма число может хранить своё целое значение. Если значение
+    известно, λ-терм строится лениво — только при применении числа к функции.
+    Результаты операций над числами без значения запоминают операцию и
+    операнды (op, operands), чтобы вычисляться без рекурсии.
     """
     
-    def __init__(self, numeral: Callable[[Callable], Callable]) -> None:
-        self.numeral = numeral
+    __slots__ = ('_numeral', 'value', 'op', 'operands')
+    
+    def __init__(self, numeral: Optional[Callable[[Callable], Callable]] = None,
+                 value: Optional[int] = None, op: Optional[str] = None,
+                 operands: Tuple["ChurchNumeral", ...] = ()) -> None:
+        if numeral is None and value is None:
+            raise ValueError("Церковное число задаётся λ-термом или значением")
+        if numeral is not None and _instrumented:
+            _count_closure()
+        self._numeral = numeral
+        self.value = value
+        self.op = op
+        self.operands = operands
+    
+    @property
+    def numeral(self) -> Callable[[Callable], Callable]:
+        if self._numeral is None:
+            self._numeral = _iterate(self.value)
+        return self._numeral
     
     def __call__(self, f: Callable) -> Callable:
-        return self.numeral(f)
+        if self.op is not None:
+            # Составное число применяется как fⁿ, а не через вложенные λ-термы.
+            numeral = _iterate(self.to_int())
+        else:
+            numeral = self.numeral
+        if _instrumented:
+            return _applied(numeral, f)
+        return numeral(f)
     
     def __str__(self) -> str:
         return str(self.to_int())
     
     def to_int(self) -> int:
-        return self.numeral(lambda x: x + 1)(0)
+        if self.value is None:
+            stats = _current()
+            if stats is None:
+                _evaluate(self)
+            else:
+                with stats.section('to_int'):
+                    _evaluate(self)
+        return self.value
+
+
+_CLOSED_FORMS: Dict[str, Callable[..., int]] = {
+    'succ': lambda n: n + 1,
+    'pred': lambda n: max(n - 1, 0),
+    'add': lambda m, n: m + n,
+    'subtract': lambda m, n: max(m - n, 0),
+    'multiply': lambda m, n: m * n,
+    'power': lambda m, n: m ** n,
+    'factorial': lambda n: factorial_cache.get(n).value,
+}
+
+
+def _evaluate(root: ChurchNumeral) -> None:
+    """
+    Вычисляет значения в дереве операций обходом с явным стеком.
+
+    Листья без операции вычисляются применением λ-терма к x ↦ x + 1,
+    а листья со своим to_int (SymbolicNumeral) — им, без развёртывания в fⁿ;
+    узлы — по замкнутой формуле от значений операндов. Значения
+    кэшируются во всех пройденных узлах.
+    """
+    stats = _current()
+    stack = [(root, False, 1)]
+    while stack:
+        node, expanded, depth = stack.pop()
+        if node.value is not None:
+            continue
+        if stats is not None and depth > stats.max_depth:
+            stats.max_depth = depth
+        if node.op is None:
+            if type(node).to_int is ChurchNumeral.to_int:
+                node.value = node(lambda x: x + 1)(0)
+            else:
+                node.value = node.to_int()
+        elif expanded:
+            node.value = _CLOSED_FORMS[node.op](*(a.value for a in node.operands))
+            if stats is not None:
+                stats.shortcuts += 1
+        else:
+            stack.append((node, True, depth))
+            stack.extend((a, False, depth + 1) for a in node.operands)
+
+
+# Церковные булевы значения.
+TRUE: Callable = lambda a: lambda b: a
+FALSE: Callable = lambda a: lambda b: b
+
+
+def _fix(F: Callable) -> Callable:
+    """Комбинатор неподвижной точки Z = λf.(λx.f(λv.x x v))(λx.f(λv.x x v))."""
+    return (lambda x: F(lambda v: x(x)(v)))(lambda x: F(lambda v: x(x)(v)))
+
+
+class _Bounce:
+    """Отложенный рекурсивный вызов: шаг возвращает его вместо вызова себя."""
+    
+    __slots__ = ('call', 'arg')
+    
+    def __init__(self, call: Callable, arg: Any) -> None:
+        self.call = call
+        self.arg = arg
+
+
+def _trampoline(result: Any) -> Any:
+    """Выполняет отложенные вызовы циклом, чтобы рекурсия не росла в стеке."""
+    while isinstance(result, _Bounce):
+        result = result.call(result.arg)
+    return result
+
+
+def _pair(a: Any, b: Any) -> Callable:
+    """Пара Чёрча: λa.λb.λs. s a b."""
+    if _instrumented:
+        _count_closure()
+    return lambda s: s(a)(b)
+
+
+def _first(p: Callable) -> Any:
+    return p(lambda a: lambda b: a)
+
+
+def _second(p: Callable) -> Any:
+    return p(lambda a: lambda b: b)
+
+
+def _known(*numerals: ChurchNumeral) -> bool:
+    """Проверяет, что у всех чисел есть кэшированное значение."""
+    known = all(n.value is not None for n in numerals)
+    if known and _instrumented:
+        stats = _current()
+        if stats is not None:
+            stats.shortcuts += 1
+    return known
+
+
+# Наблюдатели ChurchCalculator.evaluate: hook(operation, seconds)
+operation_hooks: List[Callable[[str, float], None]] = []
 
 
 class ChurchCalculator:
@@ -30,84 +299,266 @@ class ChurchCalculator:
     
     @staticmethod
     def zero() -> ChurchNumeral:
-        return ChurchNumeral(lambda f: lambda x: x)
+        return ChurchNumeral(lambda f: lambda x: x, value=0)
     
     @staticmethod
     def one() -> ChurchNumeral:
-        return ChurchNumeral(lambda f: lambda x: f(x))
+        return ChurchNumeral(lambda f: lambda x: f(x), value=1)
     
     @staticmethod
     def succ(n: ChurchNumeral) -> ChurchNumeral:
-        return ChurchNumeral(lambda f: lambda x: f(n(f)(x)))
+        if _known(n):
+            return ChurchNumeral(value=n.value + 1)
+        return ChurchNumeral(lambda f: lambda x: f(n(f)(x)), op='succ', operands=(n,))
     
     @staticmethod
     def pred(n: ChurchNumeral) -> ChurchNumeral:
-        """функция предшествования."""
-        if n.to_int() == 0:
-            return ChurchCalculator.zero()
+        """
+        Функция предшествования по Клини на парах:
+        pred = λn. fst (n (λp. pair (snd p) (succ (snd p))) (pair 0 0)).
+        Построение результата не требует вычисления n.
+        """
+        if _known(n):
+            return ChurchNumeral(value=max(n.value - 1, 0))
+        return ChurchNumeral(lambda f: ChurchCalculator._kleene_pred(n)(f),
+                             op='pred', operands=(n,))
+    
+    @staticmethod
+    def _kleene_pred(n: ChurchNumeral) -> ChurchNumeral:
+        """Вычисляет предшественника, проходя n шагов по парам (k-1, k)."""
+        zero = ChurchCalculator.zero()
+        
+        def shift(p: Callable) -> Callable:
+            return _pair(_second(p), ChurchCalculator.succ(_second(p)))
         
-        def predecessor(f: Callable) -> Callable:
-            def inner(x: Any) -> Any:
-                counter = [0]
-                result = [x]
-                
-                def wrapper(y: Any) -> Any:
-                    counter[0] += 1
-                    if counter[0] <= n.to_int() - 1:
-                        result[0] = f(y)
-                    return result[0]
-                
-                n(wrapper)(x)
-                return result[0]
-            return inner
-        return ChurchNumeral(predecessor)
+        return _first(n(shift)(_pair(zero, zero)))
     
     @staticmethod
     def add(m: ChurchNumeral, n: ChurchNumeral) -> ChurchNumeral:
-        return ChurchNumeral(lambda f: lambda x: m(f)(n(f)(x)))
+        if _known(m, n):
+            return ChurchNumeral(value=m.value + n.value)
+        return ChurchNumeral(lambda f: lambda x: m(f)(n(f)(x)),
+                             op='add', operands=(m, n))
     
     @staticmethod
     def subtract(m: ChurchNumeral, n: ChurchNumeral) -> ChurchNumeral:
-        """Исправленное вычитание."""
-        n_int = n.to_int()
-        result = m
+        """Вычитание: λm.λn. n pred m (усечённое до нуля)."""
+        if _known(m, n):
+            return ChurchNumeral(value=max(m.value - n.value, 0))
         
-        for _ in range(n_int):
-            if result.to_int() > 0:
-                result = ChurchCalculator.pred(result)
-            else:
-                break
-        return result
+        def step(k: ChurchNumeral) -> ChurchNumeral:
+            # Первый шаг проходит по парам за O(m), дальше значение известно
+            # и каждый следующий pred выполняется за O(1).
+            if _known(k):
+                return ChurchCalculator.pred(k)
+            return ChurchCalculator._kleene_pred(k)
+        
+        return ChurchNumeral(lambda f: n(step)(m)(f), op='subtract', operands=(m, n))
     
     @staticmethod
     def multiply(m: ChurchNumeral, n: ChurchNumeral) -> ChurchNumeral:
-        return ChurchNumeral(lambda f: m(n(f)))
+        if _known(m, n):
+            return ChurchNumeral(value=m.value * n.value)
+        return ChurchNumeral(lambda f: m(n(f)), op='multiply', operands=(m, n))
     
     @staticmethod
     def power(m: ChurchNumeral, n: ChurchNumeral) -> ChurchNumeral:
-        return ChurchNumeral(n(m))
+        if _known(m, n):
+            return ChurchNumeral(value=m.value ** n.value)
+        return ChurchNumeral(lambda f: n(m)(f), op='power', operands=(m, n))
     
     @staticmethod
     def factorial(n: ChurchNumeral) -> ChurchNumeral:
-        def fact_rec(num: ChurchNumeral, acc: ChurchNumeral) -> ChurchNumeral:
-            if num.to_int() <= 1:
-                return acc
-            return fact_rec(
-                ChurchCalculator.pred(num),
-                ChurchCalculator.multiply(acc, num)
-            )
+        """Факториал через общий кэш префиксных произведений."""
+        if _known(n):
+            return factorial_cache.get(n.value)
+        return ChurchNumeral(lambda f: factorial_cache.get(n.to_int())(f),
+                             op='factorial', operands=(n,))
+    
+    @staticmethod
+    def is_zero(n: ChurchNumeral) -> Callable:
+        """λn. n (λx. FALSE) TRUE — церковное булево значение."""
+        if _known(n):
+            return TRUE if n.value == 0 else FALSE
+        return n(lambda _: FALSE)(TRUE)
+    
+    @staticmethod
+    def divmod(m: ChurchNumeral, n: ChurchNumeral) -> Tuple[ChurchNumeral, ChurchNumeral]:
+        """
+        Частное и остаток повторным вычитанием через комбинатор Z:
+        div = Z (λd.λq.λr. (r < n) (q, r) (d (succ q) (r - n))).
+        Рекурсивные вызовы выполняются трамплином.
+        """
+        calc = ChurchCalculator
+        if calc.is_zero(n)(True)(False):
+            raise ValueError("Деление на ноль")
         
-        return fact_rec(n, ChurchCalculator.one())
+        def division(recur: Callable) -> Callable:
+            def step(state: Tuple[ChurchNumeral, ChurchNumeral]) -> Any:
+                q, r = state
+                # r < n  ⇔  (r + 1) - n = 0
+                done = calc.is_zero(calc.subtract(calc.succ(r), n))
+                return done(lambda: state)(
+                    lambda: _Bounce(recur, (calc.succ(q), calc.subtract(r, n))))()
+            return step
+        
+        return _trampoline(_fix(division)((calc.zero(), m)))
+    
+    @staticmethod
+    def divmod_fast(m: ChurchNumeral, n: ChurchNumeral) -> Tuple[ChurchNumeral, ChurchNumeral]:
+        """divmod по кэшированным значениям, если они известны."""
+        if _known(m, n):
+            if n.value == 0:
+                raise ValueError("Деление на ноль")
+            q, r = divmod(m.value, n.value)
+            return ChurchNumeral(value=q), ChurchNumeral(value=r)
+        return ChurchCalculator.divmod(m, n)
     
     @staticmethod
     def from_int(n: int) -> ChurchNumeral:
         if n < 0:
             raise ValueError("Church numerals can only represent non-negative integers")
         
-        church_num = ChurchCalculator.zero()
-        for _ in range(n):
-            church_num = ChurchCalculator.succ(church_num)
-        return church_num
+        return ChurchNumeral(value=n)
+    
+    @staticmethod
+    def evaluate(operation: str, a: ChurchNumeral,
+                 b: Optional[ChurchNumeral] = None) -> ChurchNumeral:
+        """Выполняет операцию парсера выражений по её имени."""
+        stats = _current()
+        if stats is None and not operation_hooks:
+            return ChurchCalculator._dispatch(operation, a, b)
+        start = time.perf_counter()
+        if stats is None:
+            result = ChurchCalculator._dispatch(operation, a, b)
+        else:
+            with stats.section(operation):
+                result = ChurchCalculator._dispatch(operation, a, b)
+        elapsed = time.perf_counter() - start
+        for hook in operation_hooks:
+            hook(operation, elapsed)
+        return result
+    
+    @staticmethod
+    def _dispatch(operation: str, a: ChurchNumeral,
+                  b: Optional[ChurchNumeral] = None) -> ChurchNumeral:
+        calc = ChurchCalculator
+        if operation == 'factorial':
+            return calc.factorial(a)
+        if operation == 'divide':
+            return calc.divmod_fast(a, b)[0]
+        operations = {
+            'add': calc.add,
+            'subtract': calc.subtract,
+            'multiply': calc.multiply,
+            'power': calc.power,
+        }
+        if operation not in operations:
+            raise ValueError(f"Неизвестная операция: {operation}")
+        return operations[operation](a, b)
+    
+    @staticmethod
+    def evaluate_many(expressions: Iterable[Tuple[str, int, Optional[int]]],
+                      max_workers: Optional[int] = None,
+                      return_exceptions: bool = False,
+                      pool: Optional[Executor] = None,
+                      timeout: Optional[float] = None) -> List[Any]:
+        """
+        Вычисляет набор выражений (operation, a, b) за один вызов.
+
+        Одинаковые выражения и операнды вычисляются один раз, уникальные
+        выражения распределяются по пулу потоков: переданному pool или
+        временному из max_workers потоков. Результаты возвращаются
+        в порядке входных выражений; при return_exceptions ошибка отдельного
+        выражения возвращается на его месте вместо исключения. Выражения,
+        не вычисленные за timeout секунд, получают TimeoutError.
+        """
+        expressions = [tuple(expression) for expression in expressions]
+        unique = list(dict.fromkeys(expressions))
+        numerals: Dict[int, ChurchNumeral] = {}
+        
+        for _, a, b in unique:
+            for n in (a, b):
+                if n is not None and n not in numerals:
+                    numerals[n] = ChurchCalculator.from_int(n)
+        
+        def run(expression: Tuple[str, int, Optional[int]]) -> Any:
+            operation, a, b = expression
+            try:
+                return ChurchCalculator.evaluate(operation, numerals[a], numerals.get(b))
+            except Exception as e:
+                if return_exceptions:
+                    return e
+                raise
+        
+        own_pool = pool is None
+        if own_pool:
+            pool = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            futures = {expression: pool.submit(run, expression) for expression in unique}
+            wait(futures.values(), timeout=timeout)
+            results = {}
+            for expression, future in futures.items():
+                if future.done():
+                    results[expression] = future.result()
+                    continue
+                future.cancel()
+                error = TimeoutError(f"Выражение не вычислено за {timeout:g} с")
+                if not return_exceptions:
+                    raise error
+                results[expression] = error
+        finally:
+            if own_pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+        return [results[expression] for expression in expressions]
+
+
+class FactorialCache:
+    """
+    Ограниченная по размеру LRU-таблица уже вычисленных n!.
+
+    Для нового n произведение продолжается от наибольшего закэшированного
+    k ≤ n циклом, без рекурсии. Таблица общая для всех вызовов factorial.
+    """
+    
+    def __init__(self, maxsize: int = 256) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._table: "OrderedDict[int, ChurchNumeral]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, n: int) -> ChurchNumeral:
+        with self._lock:
+            cached = self._table.get(n)
+            if cached is not None:
+                self._table.move_to_end(n)
+                self.hits += 1
+                return cached
+            self.misses += 1
+            start = max((k for k in self._table if k < n), default=0)
+            acc = self._table[start] if start else ChurchCalculator.one()
+        
+        for k in range(start + 1, n + 1):
+            acc = ChurchCalculator.multiply(acc, ChurchCalculator.from_int(k))
+        
+        with self._lock:
+            self._table[n] = acc
+            self._table.move_to_end(n)
+            while len(self._table) > self.maxsize:
+                self._table.popitem(last=False)
+        return acc
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._table.clear()
+            self.hits = self.misses = 0
+    
+    def __len__(self) -> int:
+        return len(self._table)
+
+
+factorial_cache = FactorialCache()
 
 
 def church_to_int(church_num: ChurchNumeral) -> int:
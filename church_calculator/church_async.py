@@ -0,0 +1,194 @@
+"""
+Асинхронная веб-версия калькулятора Чёрча на FastAPI.
+
+Повторяет /calculate, /history и /health веб-версии на Flask с той же
+схемой JSON. Вычисления выполняются в пуле потоков (тяжёлые операции
+оттуда уходят в процессы ChurchExecutor), история читается
+и пишется через AsyncHistory, поэтому цикл событий не блокируется и может
+держать открытыми тысячи соединений.
+
+    uvicorn church_async:app --host 0.0.0.0 --port 5001 --workers 4
+"""
+
+import asyncio
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, nullcontext
+from typing import Optional
+
+# Добавляем путь к корневой директории для импорта
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+try:
+    from database import AsyncHistory, CalculationHistory, HistoryWriter
+    from retention import RetentionPolicy
+    db = CalculationHistory()
+    DATABASE_AVAILABLE = True
+except Exception as e:
+    print(f"База данных недоступна: {e}")
+    db = None
+    DATABASE_AVAILABLE = False
+
+try:
+    from app.church import instrument
+    from app.executor import ChurchExecutor
+    from app.cost import CostBudget, TooExpensiveError
+    from app.calculation import CalculationPipeline
+    from app import metrics
+except ImportError:
+    try:
+        from church import instrument
+        from executor import ChurchExecutor
+        from cost import CostBudget, TooExpensiveError
+        from calculation import CalculationPipeline
+        import metrics
+    except ImportError:
+        print("Ошибка: Не удалось найти модуль church.py")
+        raise
+
+# Потоков для вычислений: тяжёлые операции ждут процессы ChurchExecutor, а не CPU
+CALCULATION_THREADS = int(os.environ.get('CHURCH_CALCULATION_THREADS', 8))
+
+# Наибольшее число записей на одной странице истории
+MAX_HISTORY_PAGE = 500
+
+cost_budget = CostBudget()
+church_executor = ChurchExecutor(inline_bits=cost_budget.inline_result_bits)
+pipeline = CalculationPipeline(cost_budget, church_executor,
+                               store=db if DATABASE_AVAILABLE else None)
+pipeline.warm()
+metrics.register_pipeline(pipeline, lambda: history_writer)
+
+calculation_executor = ThreadPoolExecutor(max_workers=CALCULATION_THREADS,
+                                          thread_name_prefix="calculation")
+history_writer = None
+history = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Фоновые потоки истории живут, пока работает приложение."""
+    global history_writer, history
+    retention = None
+    if DATABASE_AVAILABLE:
+        history_writer = HistoryWriter(db)
+        history = AsyncHistory(db, history_writer)
+        retention = RetentionPolicy(db)
+        retention.start()
+    try:
+        yield
+    finally:
+        if retention is not None:
+            retention.stop()
+        if history is not None:
+            history.close()
+            history_writer.close()
+            history = history_writer = None
+        calculation_executor.shutdown(wait=False)
+        church_executor.shutdown()
+        if db is not None:
+            db.close()
+
+
+app = FastAPI(title="Калькулятор Чёрча", lifespan=lifespan)
+
+
+@app.get('/health')
+async def health_check():
+    """Проверка статуса приложения и базы данных."""
+    return JSONResponse({
+        'status': 'healthy',
+        'database_available': DATABASE_AVAILABLE,
+        'cache': pipeline.stats(),
+        'history_queue': history_writer.stats() if history_writer else None
+    })
+
+
+def calculate_profiled(expression: str, profiled: bool):
+    """Вычисление с подсчётом работы λ-движка, если он запрошен."""
+    with instrument() if profiled else nullcontext() as stats:
+        return pipeline.calculate(expression), stats
+
+
+@app.get('/metrics')
+async def metrics_endpoint():
+    """Метрики процесса в текстовом формате Prometheus."""
+    return Response(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.post('/calculate')
+async def calculate(request: Request):
+    """API endpoint для вычислений."""
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if not data:
+            return JSONResponse({'error': 'No JSON data provided'}, status_code=400)
+
+        expression = data.get('expression', '').strip()
+
+        if not expression:
+            return JSONResponse({'error': 'Введите математическое выражение'}, status_code=400)
+
+        # Разбор и вычисление вне цикла событий; счётчики instrument()
+        # ведутся в потоке, где идёт вычисление
+        loop = asyncio.get_running_loop()
+        calculation, stats = await loop.run_in_executor(
+            calculation_executor, calculate_profiled, expression, bool(data.get('instrument')))
+
+        if DATABASE_AVAILABLE and history:
+            await history.submit(calculation.expression, calculation.result,
+                                 calculation.operation)
+
+        response_data = {
+            'success': True,
+            'result': calculation.result,
+            'database_available': DATABASE_AVAILABLE
+        }
+
+        if calculation.warning:
+            response_data['warning'] = calculation.warning
+        if stats is not None:
+            response_data['instrumentation'] = stats.as_dict()
+
+        return JSONResponse(response_data)
+
+    except TooExpensiveError as e:
+        return JSONResponse({
+            'success': False,
+            'error': str(e),
+            'too_expensive': True
+        }, status_code=422)
+    except Exception as e:
+        return JSONResponse({
+            'success': False,
+            'error': str(e)
+        }, status_code=400)
+
+
+@app.get('/history')
+async def get_history(limit: int = 10, before_id: Optional[int] = None):
+    """Получить историю вычислений."""
+    if not DATABASE_AVAILABLE or not history:
+        return JSONResponse({'error': 'База данных недоступна', 'history': []})
+
+    # Страница по ключу: следующая запрашивается с before_id = next_before_id
+    limit = min(max(limit, 1), MAX_HISTORY_PAGE)
+    rows = await history.get_calculation_history(limit, before_id)
+    next_before_id = rows[-1]['id'] if len(rows) == limit else None
+    return JSONResponse({'history': rows, 'next_before_id': next_before_id})
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    print("Запуск асинхронного веб-сервера калькулятора Чёрча...")
+    print("Адрес: http://localhost:5001")
+
+    uvicorn.run(app, host='0.0.0.0', port=5001)
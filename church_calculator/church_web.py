@@ -4,15 +4,18 @@
 
 import sys
 import os
-import re
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
 
 # Добавляем путь к корневой директории для импорта
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 
 try:
-    from database import CalculationHistory
+    from database import CalculationHistory, HistoryWriter
+    from retention import RetentionPolicy
     db = CalculationHistory()
     DATABASE_AVAILABLE = True
 except Exception as e:
@@ -20,11 +23,24 @@ except Exception as e:
     db = None
     DATABASE_AVAILABLE = False
 
+history_writer = None
+retention = None
+
 try:
-    from app.church import ChurchCalculator, church_to_int, int_to_church
+    from app.church import instrument
+    from app.executor import ChurchExecutor
+    from app.cost import CostBudget, TooExpensiveError
+    from app.expression_parser import ExpressionParser
+    from app.calculation import CalculationPipeline
+    from app import metrics
 except ImportError:
     try:
-        from church import ChurchCalculator, church_to_int, int_to_church
+        from church import instrument
+        from executor import ChurchExecutor
+        from cost import CostBudget, TooExpensiveError
+        from expression_parser import ExpressionParser
+        from calculation import CalculationPipeline
+        import metrics
     except ImportError:
         print("Ошибка: Не удалось найти модуль church.py")
         raise
@@ -32,29 +48,49 @@ except ImportError:
 app = Flask(__name__)
 app.secret_key = 'church_calculator_secret_key_2024'
 
-class ExpressionParser:
-    @staticmethod
-    def parse_expression(expression: str) -> tuple:
-        expression = expression.strip().replace(' ', '').replace(',', '.')
-        
-        patterns = {
-            'factorial': r'^([0-9]+\.?[0-9]*)!$',
-            'power': r'^([0-9]+\.?[0-9]*)\^([0-9]+\.?[0-9]*)$',
-            'multiply': r'^([0-9]+\.?[0-9]*)\*([0-9]+\.?[0-9]*)$',
-            'divide': r'^([0-9]+\.?[0-9]*)/([0-9]+\.?[0-9]*)$',
-            'add': r'^([0-9]+\.?[0-9]*)\+([0-9]+\.?[0-9]*)$',
-            'subtract': r'^([0-9]+\.?[0-9]*)-([0-9]+\.?[0-9]*)$'
-        }
-        
-        for operation, pattern in patterns.items():
-            match = re.match(pattern, expression)
-            if match:
-                if operation == 'factorial':
-                    return operation, float(match.group(1)), None
-                else:
-                    return operation, float(match.group(1)), float(match.group(2))
-        
-        raise ValueError("Неподдерживаемое выражение или некорректный формат")
+# Слишком дорогие выражения отклоняются до вычисления, тяжёлые факториалы
+# и степени считаются в отдельных процессах с тайм-аутом
+cost_budget = CostBudget()
+church_executor = ChurchExecutor(inline_bits=cost_budget.inline_result_bits)
+
+# Повторяющиеся выражения берутся из общего LRU-кэша результатов, а уже
+# вычислявшиеся ранее — из истории; кэш заполняется частыми выражениями
+pipeline = CalculationPipeline(cost_budget, church_executor,
+                               store=db if DATABASE_AVAILABLE else None)
+pipeline.warm()
+metrics.register_pipeline(pipeline, lambda: history_writer)
+
+def start_services():
+    """Запускает фоновые потоки истории в текущем процессе."""
+    global history_writer, retention
+    if not DATABASE_AVAILABLE or history_writer is not None:
+        return
+    # История пишется фоновым потоком пакетами, вне пути запроса
+    history_writer = HistoryWriter(db)
+    # Старые вычисления раз в сутки уходят в архив с дневными итогами
+    retention = RetentionPolicy(db)
+    retention.start()
+
+def stop_services():
+    """
+    Останавливает фоновые потоки, процессы вычислений и соединения с базой.
+    Вызывается при выходе и в главном процессе сервера перед fork:
+    потоки и соединения SQLite не переживают fork, поэтому рабочие
+    процессы открывают их заново через start_services.
+    """
+    global history_writer, retention
+    if retention is not None:
+        retention.stop()
+        retention = None
+    if history_writer is not None:
+        history_writer.close()
+        history_writer = None
+    church_executor.shutdown()
+    if db is not None:
+        db.close()
+
+atexit.register(stop_services)
+start_services()
 
 HTML = """
 <!DOCTYPE html>
@@ -414,9 +450,16 @@ def health_check():
     """Проверка статуса приложения и базы данных."""
     return jsonify({
         'status': 'healthy',
-        'database_available': DATABASE_AVAILABLE
+        'database_available': DATABASE_AVAILABLE,
+        'cache': pipeline.stats(),
+        'history_queue': history_writer.stats() if history_writer else None
     })
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """Метрики процесса в текстовом формате Prometheus."""
+    return Response(metrics.REGISTRY.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/calculate', methods=['POST'])
 def calculate():
     """API endpoint для вычислений."""
@@ -430,59 +473,18 @@ def calculate():
         if not expression:
             return jsonify({'error': 'Введите математическое выражение'}), 400
         
-        parsed = ExpressionParser.parse_expression(expression)
-        operation = parsed[0]
-        
-        result = None
-        warning = None
+        # По запросу считается работа λ-движка: применения f, замыкания, глубина
+        profile = instrument() if data.get('instrument') else nullcontext()
+        with profile as stats:
+            calculation = pipeline.calculate(expression)
+        result = calculation.result
+        operation = calculation.operation
+        warning = calculation.warning
         
-        if operation == 'factorial':
-            n = parsed[1]
-            
-            if n != int(n):
-                raise ValueError("Факториал определен только для целых чисел")
-            
-            church_n = int_to_church(int(n))
-            result_church = ChurchCalculator.factorial(church_n)
-            result = church_to_int(result_church)
-            
-        else:
-            a, b = parsed[1], parsed[2]
-            int_a, int_b = int(a), int(b)
-            
-            # Проверка для вычитания
-            if operation == 'subtract' and int_a < int_b:
-                warning = f"Внимание: уменьшаемое меньше вычитаемого. Ответ 0."
-                result = 0
-            else:
-                church_a = int_to_church(int_a)
-                church_b = int_to_church(int_b)
-                
-                if operation == 'add':
-                    result_church = ChurchCalculator.add(church_a, church_b)
-                    result = church_to_int(result_church)
-                    
-                elif operation == 'subtract':
-                    result_church = ChurchCalculator.subtract(church_a, church_b)
-                    result = church_to_int(result_church)
-                    
-                elif operation == 'multiply':
-                    result_church = ChurchCalculator.multiply(church_a, church_b)
-                    result = church_to_int(result_church)
-                    
-                elif operation == 'divide':
-                    if int_b == 0:
-                        raise ValueError("Деление на ноль")
-                    result = int_a // int_b
-                    
-                elif operation == 'power':
-                    result_church = ChurchCalculator.power(church_a, church_b)
-                    result = church_to_int(result_church)
-        
-        # Сохраняем в базу данных если она доступна
-        if DATABASE_AVAILABLE and db:
-            db.save_calculation(
-                expression=expression,
+        # Ставим в очередь записи в базу данных если она доступна
+        if DATABASE_AVAILABLE and history_writer:
+            history_writer.submit(
+                expression=calculation.expression,
                 result=result,
                 operation_type=operation
             )
@@ -495,27 +497,93 @@ def calculate():
         
         if warning:
             response_data['warning'] = warning
+        if stats is not None:
+            response_data['instrumentation'] = stats.as_dict()
         
         return jsonify(response_data)
         
+    except TooExpensiveError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e),
+            'too_expensive': True
+        }), 422
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 400
 
+# Наибольшее число выражений в одном пакетном запросе
+MAX_BATCH_SIZE = 1000
+
+# Общий срок пакетного запроса, секунды, и потоки для его вычислений
+BATCH_TIMEOUT = float(os.environ.get('CHURCH_BATCH_TIMEOUT', 10))
+BATCH_THREADS = int(os.environ.get('CHURCH_BATCH_THREADS', 4))
+
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_THREADS, thread_name_prefix="batch")
+
+@app.route('/calculate/batch', methods=['POST'])
+def calculate_batch():
+    """API endpoint для пакетных вычислений."""
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('expressions'), list):
+        return jsonify({'error': 'Ожидается JSON со списком expressions'}), 400
+    
+    expressions = [str(expression).strip() for expression in data['expressions']]
+    if len(expressions) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Не более {MAX_BATCH_SIZE} выражений за запрос'}), 400
+    
+    # Те же кэш, история и оценка стоимости, что и у /calculate; одинаковые
+    # выражения и подвыражения считаются один раз, весь пакет — за BATCH_TIMEOUT
+    nonempty = [expression for expression in expressions if expression]
+    outcomes = dict(zip(nonempty, pipeline.calculate_many(nonempty, batch_executor, BATCH_TIMEOUT)))
+    
+    items = []
+    records = []
+    for expression in expressions:
+        outcome = outcomes.get(expression, ValueError('Введите математическое выражение'))
+        if isinstance(outcome, TooExpensiveError):
+            items.append({'expression': expression, 'success': False,
+                          'error': str(outcome), 'too_expensive': True})
+        elif isinstance(outcome, Exception):
+            items.append({'expression': expression, 'success': False, 'error': str(outcome)})
+        else:
+            item = {'expression': expression, 'success': True, 'result': outcome.result}
+            if outcome.warning:
+                item['warning'] = outcome.warning
+            items.append(item)
+            records.append((outcome.expression, outcome.result, outcome.operation))
+    
+    # История пакета уходит в очередь записи целиком, по записи на выражение
+    if DATABASE_AVAILABLE and history_writer and records:
+        history_writer.submit_many(records)
+    
+    return jsonify({
+        'success': True,
+        'results': items,
+        'database_available': DATABASE_AVAILABLE
+    })
+
+# Наибольшее число записей на одной странице истории
+MAX_HISTORY_PAGE = 500
+
 @app.route('/history', methods=['GET'])
 def get_history():
     """Получить историю вычислений."""
     if not DATABASE_AVAILABLE or not db:
         return jsonify({'error': 'База данных недоступна', 'history': []})
     
-    limit = request.args.get('limit', 10, type=int)
-    history = db.get_calculation_history(limit=limit)
-    return jsonify({'history': history})
+    # Страница по ключу: следующая запрашивается с before_id = next_before_id
+    limit = min(max(request.args.get('limit', 10, type=int), 1), MAX_HISTORY_PAGE)
+    before_id = request.args.get('before_id', type=int)
+    history = db.get_calculation_history(limit=limit, before_id=before_id)
+    next_before_id = history[-1]['id'] if len(history) == limit else None
+    return jsonify({'history': history, 'next_before_id': next_before_id})
 
 if __name__ == '__main__':
     print("Запуск веб-сервера калькулятора Чёрча...")
     print("Откройте в браузере: http://localhost:5000")
+    print("Для нагрузки используйте рабочий режим: python serve.py")
     
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
@@ -0,0 +1,193 @@
+"""
+Оценка стоимости выражений калькулятора Чёрча и допуск к вычислению.
+
+По кортежу (operation, a, b) из ExpressionParser.parse_expression
+оценивается число применений f, которое потребовалось бы to_int()
+в чисто λ-вычислении, и размер результата. По настраиваемым бюджетам решается, считать ли
+выражение сразу, отправить в отдельный процесс или отклонить.
+Вложенные выражения оцениваются по дереву разбора (estimate_tree).
+"""
+
+import math
+from typing import Optional, Tuple
+
+from symbolic import Add, Div, Expr, Fact, Mul, Num, Pow, Sub, walk
+
+
+# Решения допуска
+ACCEPT = 'accept'
+QUEUE = 'queue'
+REJECT = 'reject'
+
+# Результат длиннее этого числа бит считается в отдельном процессе
+INLINE_RESULT_BITS = 2 ** 16
+
+# Результат длиннее этого числа бит не вычисляется вовсе. Перевод результата
+# в десятичный текст для ответа и истории идёт в потоке запроса и растёт
+# квадратично: для 2^18 бит около 0.15 с, для 2^20 — уже около 2 с
+MAX_RESULT_BITS = 2 ** 18
+
+
+class TooExpensiveError(Exception):
+    """Вычисление отклонено или не уложилось в отведённые ресурсы."""
+    pass
+
+
+# Целые длиннее этого числа бит не переводятся в float при оценке
+_FLOAT_BITS = 1000
+
+
+def _log2(n: int) -> float:
+    return math.log2(n) if n > 0 else 0.0
+
+
+def _log2_sum(x: float, y: float) -> float:
+    """log2(2^x + 2^y) без вычисления самих степеней."""
+    high, low = max(x, y), min(x, y)
+    return high + math.log2(1 + 2 ** (low - high))
+
+
+def _result_bits(log_value: float) -> int:
+    """Длина результата в битах по log2 его значения, в том числе бесконечному."""
+    return int(min(log_value, 2 ** 62)) + 1
+
+
+class CostEstimate:
+    """
+    Оценка стоимости выражения.
+
+    log2_applications — двоичный логарифм числа применений f при вычислении
+    λ-термов (построение операндов и to_int результата), result_bits — длина
+    результата в битах.
+    """
+
+    __slots__ = ('operation', 'log2_applications', 'result_bits')
+
+    def __init__(self, operation: str, log2_applications: float, result_bits: int) -> None:
+        self.operation = operation
+        self.log2_applications = log2_applications
+        self.result_bits = result_bits
+
+    @property
+    def applications(self) -> float:
+        return 2 ** min(self.log2_applications, 1023.0)
+
+    @property
+    def memory_bytes(self) -> int:
+        """Память под результат при вычислении через кэшированное значение."""
+        return self.result_bits // 8 + 28
+
+    def __repr__(self) -> str:
+        return (f"CostEstimate({self.operation!r}, log2_applications="
+                f"{self.log2_applications:.1f}, result_bits={self.result_bits})")
+
+
+def estimate(operation: str, a: float, b: Optional[float] = None) -> CostEstimate:
+    """Оценивает стоимость выражения по результату parse_expression."""
+    a = int(a)
+    b = 0 if b is None else int(b)
+    log_a, log_b = _log2(a), _log2(b)
+    operands = _log2_sum(log_a, log_b)
+
+    if operation == 'factorial':
+        if a.bit_length() <= _FLOAT_BITS:
+            log_result = math.lgamma(a + 1) / math.log(2)
+        else:
+            log_result = _log2_power(log_a, log_a)
+        result_bits = _result_bits(log_result)
+        work = _log2_sum(log_a, log_result)
+    elif operation == 'power':
+        if a <= 1:
+            log_result = 0.0
+        elif b.bit_length() <= _FLOAT_BITS:
+            log_result = b * log_a
+        else:
+            log_result = _log2_power(log_a, log_b)
+        result_bits = _result_bits(log_result)
+        work = _log2_sum(operands, log_result)
+    elif operation == 'multiply':
+        result_bits = a.bit_length() + b.bit_length()
+        work = _log2_sum(operands, log_a + log_b)
+    elif operation == 'subtract':
+        # n pred m: n шагов по парам длины до m
+        result_bits = a.bit_length()
+        work = _log2_sum(operands, log_a + log_b)
+    elif operation == 'divide':
+        # Повторное вычитание: a // b шагов
+        result_bits = a.bit_length()
+        work = _log2_sum(operands, log_a - log_b + log_a) if b else operands
+    else:
+        result_bits = max(a.bit_length(), b.bit_length()) + 1
+        work = operands + 1
+    return CostEstimate(operation, work, max(result_bits, 1))
+
+
+def _log2_power(log_base: float, log_exponent: float) -> float:
+    """log2(a^b) = b·log2(a) по логарифмам a и b."""
+    if log_base == 0.0:
+        return 0.0
+    if log_exponent > 1000:
+        return math.inf
+    return 2 ** log_exponent * log_base
+
+
+def estimate_tree(tree: Expr) -> CostEstimate:
+    """
+    Оценивает дерево выражения снизу вверх: для каждого узла по оценкам
+    операндов вычисляется верхняя граница log2 значения и работы.
+    """
+    def visit(node: Expr, operands: Tuple[Tuple[float, float], ...]) -> Tuple[float, float]:
+        if isinstance(node, Num):
+            log_value = _log2(node.value)
+            return log_value, log_value
+        logs = [log_value for log_value, _ in operands]
+        work = max(w for _, w in operands)
+        if isinstance(node, Add):
+            log_value = max(logs) + 1
+        elif isinstance(node, (Sub, Div)):
+            log_value = logs[0]
+        elif isinstance(node, Mul):
+            log_value = logs[0] + logs[1]
+        elif isinstance(node, Pow):
+            log_value = _log2_power(logs[0], logs[1])
+        elif isinstance(node, Fact):
+            # log2(n!) <= n·log2(n)
+            log_value = _log2_power(logs[0], logs[0])
+        else:
+            log_value = max(logs)
+        return log_value, _log2_sum(work, log_value)
+
+    log_value, work = walk(tree, visit)
+    return CostEstimate('expression', work, _result_bits(log_value))
+
+
+class CostBudget:
+    """Бюджеты, по которым выражение принимается, ставится в очередь или отклоняется."""
+
+    def __init__(self, inline_result_bits: int = INLINE_RESULT_BITS,
+                 max_result_bits: int = MAX_RESULT_BITS) -> None:
+        self.inline_result_bits = inline_result_bits
+        self.max_result_bits = max_result_bits
+
+    def admit(self, cost: CostEstimate) -> str:
+        if cost.result_bits > self.max_result_bits:
+            return REJECT
+        if cost.result_bits > self.inline_result_bits:
+            return QUEUE
+        return ACCEPT
+
+    def check(self, operation: str, a: float, b: Optional[float] = None) -> str:
+        """Оценивает выражение и выбрасывает TooExpensiveError, если оно отклонено."""
+        return self._decide(estimate(operation, a, b))
+
+    def check_tree(self, tree: Expr) -> str:
+        """То же, что check, для дерева вложенного выражения."""
+        return self._decide(estimate_tree(tree))
+
+    def _decide(self, cost: CostEstimate) -> str:
+        decision = self.admit(cost)
+        if decision == REJECT:
+            raise TooExpensiveError(
+                f"Вычисление слишком дорогое: результат около {cost.result_bits} бит "
+                f"при допустимых {self.max_result_bits}")
+        return decision
@@ -0,0 +1,533 @@
+"""
+История вычислений калькулятора Чёрча в SQLite.
+
+Общий слой хранения для веб-версии и графического интерфейса. Каждый поток
+работает через своё соединение из пула, база открывается в режиме WAL
+с synchronous=NORMAL, поэтому запись не блокирует чтение, а параллельные
+записи ждут друг друга, а не завершаются ошибкой «database is locked».
+Тексты запросов постоянны: sqlite3 кэширует подготовленные выражения
+на каждом соединении.
+
+HistoryWriter выносит запись истории из пути запроса: вычисления
+складываются в ограниченную очередь, которую фоновый поток сбрасывает
+пакетами одной транзакцией.
+
+Об изменениях истории в этом процессе сообщают подписчики subscribe():
+событие 'insert' после записи и 'clear' после очистки. Изменения из других
+процессов обнаруживает ChangeWatcher по PRAGMA data_version.
+
+AsyncHistory даёт асинхронной веб-версии неблокирующий доступ к истории:
+запросы к SQLite выполняются в отдельном пуле потоков, а цикл событий
+только ждёт результата.
+"""
+
+import asyncio
+import os
+import queue
+import sqlite3
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from metrics import DB_SECONDS
+
+
+# Файл базы по умолчанию; переменная окружения CHURCH_DB_PATH задаёт другой
+DEFAULT_DB_PATH = "calculator.db"
+
+# Сколько ждать освобождения базы другим писателем, секунды
+BUSY_TIMEOUT = 30.0
+
+# Параметры отложенной записи: размер очереди, размер пакета,
+# наибольшая задержка записи и ожидание места в полной очереди, секунды
+WRITE_QUEUE_SIZE = 10000
+WRITE_BATCH_SIZE = 256
+WRITE_INTERVAL = 0.5
+WRITE_PUT_TIMEOUT = 1.0
+
+# Потоков для запросов асинхронной веб-версии к базе
+ASYNC_DB_THREADS = 4
+
+_SCHEMA = (
+    '''
+    CREATE TABLE IF NOT EXISTS calculations (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        expression TEXT NOT NULL,
+        result TEXT NOT NULL,
+        operation_type TEXT NOT NULL,
+        timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    ''',
+    # Поиск готового результата перед вычислением
+    '''
+    CREATE INDEX IF NOT EXISTS idx_calculations_expression
+    ON calculations (expression, operation_type)
+    ''',
+    # Счётчики по типам операций обновляются триггерами в той же
+    # транзакции, что и изменение calculations
+    '''
+    CREATE TABLE IF NOT EXISTS statistics (
+        operation_type TEXT PRIMARY KEY,
+        count INTEGER NOT NULL DEFAULT 0,
+        last_used DATETIME
+    )
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS statistics_on_insert AFTER INSERT ON calculations
+    BEGIN
+        INSERT INTO statistics (operation_type, count, last_used)
+        VALUES (NEW.operation_type, 1, NEW.timestamp)
+        ON CONFLICT (operation_type) DO UPDATE
+        SET count = count + 1, last_used = excluded.last_used;
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS statistics_on_delete AFTER DELETE ON calculations
+    BEGIN
+        UPDATE statistics SET count = count - 1
+        WHERE operation_type = OLD.operation_type;
+        DELETE FROM statistics
+        WHERE operation_type = OLD.operation_type AND count <= 0;
+    END
+    ''',
+    # Дневные итоги по вычислениям, перенесённым в архив (см. retention.py)
+    '''
+    CREATE TABLE IF NOT EXISTS daily_statistics (
+        day TEXT NOT NULL,
+        operation_type TEXT NOT NULL,
+        count INTEGER NOT NULL,
+        PRIMARY KEY (day, operation_type)
+    )
+    ''',
+)
+
+# Пересчёт счётчиков по всей истории: только при создании или переходе
+# со старой таблицы statistics без ключа
+_REBUILD_STATISTICS = '''
+    INSERT INTO statistics (operation_type, count, last_used)
+    SELECT operation_type, COUNT(*), MAX(timestamp)
+    FROM calculations
+    GROUP BY operation_type
+'''
+
+_INSERT = 'INSERT INTO calculations (expression, result, operation_type) VALUES (?, ?, ?)'
+_HISTORY = 'SELECT * FROM calculations ORDER BY id DESC LIMIT ?'
+# Страница истории по ключу: записи старше before_id, без OFFSET
+_HISTORY_BEFORE = 'SELECT * FROM calculations WHERE id < ? ORDER BY id DESC LIMIT ?'
+_FIND_RESULT = '''
+    SELECT result FROM calculations
+    WHERE expression = ? AND operation_type = ?
+    ORDER BY id DESC
+    LIMIT 1
+'''
+_MOST_FREQUENT = '''
+    SELECT expression, operation_type, result, MAX(id)
+    FROM calculations
+    GROUP BY expression, operation_type
+    ORDER BY COUNT(*) DESC
+    LIMIT ?
+'''
+_STATISTICS = 'SELECT operation_type, count FROM statistics ORDER BY count DESC, operation_type'
+
+
+class _ThreadConnection:
+    """Соединение одного потока; закрывается, когда поток завершается."""
+
+    __slots__ = ('conn', '__weakref__')
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.conn = conn
+        weakref.finalize(self, conn.close)
+
+
+class ConnectionPool:
+    """
+    Соединения с базой, по одному на поток. Соединение хранится в данных
+    потока и закрывается вместе с ними при завершении потока, поэтому
+    короткоживущие потоки (запросы Flask, пул QThreadPool) не оставляют
+    открытых соединений.
+    """
+
+    def __init__(self, db_path: str, timeout: float = BUSY_TIMEOUT) -> None:
+        self.db_path = db_path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections: "weakref.WeakSet[_ThreadConnection]" = weakref.WeakSet()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        """Число открытых соединений."""
+        with self._lock:
+            return len(self._connections)
+
+    def connection(self) -> sqlite3.Connection:
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            conn = sqlite3.connect(self.db_path, timeout=self.timeout,
+                                   check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            holder = self._local.holder = _ThreadConnection(conn)
+            with self._lock:
+                self._connections.add(holder)
+        return holder.conn
+
+    def release(self) -> None:
+        """Закрывает соединение текущего потока, если оно было открыто."""
+        holder = getattr(self._local, 'holder', None)
+        if holder is None:
+            return
+        self._local.holder = None
+        with self._lock:
+            self._connections.discard(holder)
+        holder.conn.close()
+
+    def close_all(self) -> None:
+        """Закрывает соединения всех потоков."""
+        with self._lock:
+            holders = list(self._connections)
+            self._connections = weakref.WeakSet()
+            self._local = threading.local()
+        for holder in holders:
+            holder.conn.close()
+
+
+# Подписчик получает тип изменения и число затронутых записей
+ChangeListener = Callable[[str, int], None]
+
+
+class CalculationHistory:
+    """Хранилище истории вычислений для веб-версии и графического интерфейса."""
+
+    def __init__(self, db_path: Optional[str] = None) -> None:
+        self.db_path = db_path or os.environ.get('CHURCH_DB_PATH', DEFAULT_DB_PATH)
+        self.pool = ConnectionPool(self.db_path)
+        self._listeners: List[ChangeListener] = []
+        self._listeners_lock = threading.Lock()
+        self._ensure_database()
+
+    def _ensure_database(self) -> None:
+        """Создает таблицы и индексы при необходимости."""
+        try:
+            conn = self.pool.connection()
+            with conn:
+                conn.execute('BEGIN IMMEDIATE')
+                columns = [row[1] for row in conn.execute('PRAGMA table_info(statistics)')]
+                if 'id' in columns:
+                    # Старая таблица без ключа по operation_type
+                    conn.execute('DROP TABLE statistics')
+                for statement in _SCHEMA:
+                    conn.execute(statement)
+                if 'operation_type' not in columns or 'id' in columns:
+                    conn.execute(_REBUILD_STATISTICS)
+        except sqlite3.Error as e:
+            print(f"Ошибка базы данных: {e}")
+
+    def close(self) -> None:
+        self.pool.close_all()
+
+    def subscribe(self, listener: ChangeListener) -> None:
+        """Подписывает listener(event, count) на изменения истории в этом процессе."""
+        with self._listeners_lock:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener: ChangeListener) -> None:
+        with self._listeners_lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def notify(self, event: str, count: int = 0) -> None:
+        """Сообщает подписчикам об изменении; вызывается после фиксации транзакции."""
+        with self._listeners_lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(event, count)
+            except Exception as e:
+                print(f"Ошибка обработчика изменений: {e}")
+
+    def save_calculation(self, expression: str, result: Any, operation_type: str) -> bool:
+        """Сохраняет одно вычисление."""
+        return self.save_calculations([(expression, result, operation_type)])
+
+    def save_calculations(self, records: Iterable[Tuple[str, Any, str]]) -> bool:
+        """Сохраняет несколько вычислений одной транзакцией."""
+        rows = [(expression, str(result), operation_type)
+                for expression, result, operation_type in records]
+        try:
+            conn = self.pool.connection()
+            with DB_SECONDS.time('insert'), conn:
+                conn.executemany(_INSERT, rows)
+        except sqlite3.Error as e:
+            print(f"Ошибка сохранения: {e}")
+            return False
+        self.notify('insert', len(rows))
+        return True
+
+    def get_calculation_history(self, limit: int = 10,
+                                before_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Возвращает последние вычисления, новые первыми. При before_id —
+        страницу вычислений с id меньше before_id.
+        """
+        try:
+            conn = self.pool.connection()
+            with DB_SECONDS.time('history'):
+                if before_id is None:
+                    rows = conn.execute(_HISTORY, (limit,)).fetchall()
+                else:
+                    rows = conn.execute(_HISTORY_BEFORE, (before_id, limit)).fetchall()
+            return [dict(row) for row in rows]
+        except sqlite3.Error:
+            return []
+
+    def iter_calculation_history(self, page_size: int = 100,
+                                 before_id: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """Перебирает историю от новых к старым, читая по page_size записей."""
+        while True:
+            page = self.get_calculation_history(page_size, before_id)
+            yield from page
+            if len(page) < page_size:
+                return
+            before_id = page[-1]['id']
+
+    def get_statistics(self) -> Dict[str, Any]:
+        """Число вычислений по типам операций из таблицы счётчиков."""
+        try:
+            with DB_SECONDS.time('statistics'):
+                rows = self.pool.connection().execute(_STATISTICS).fetchall()
+            stats = [tuple(row) for row in rows]
+            return {
+                'stats': stats,
+                'total_calculations': sum(count for _, count in stats),
+                'operation_types': len(stats)
+            }
+        except sqlite3.Error:
+            return {'stats': [], 'total_calculations': 0, 'operation_types': 0}
+
+    def clear_history(self) -> bool:
+        """Очищает историю вычислений."""
+        try:
+            conn = self.pool.connection()
+            with conn:
+                conn.execute('DELETE FROM calculations')
+                conn.execute('DELETE FROM statistics')
+                conn.execute('DELETE FROM daily_statistics')
+        except sqlite3.Error:
+            return False
+        self.notify('clear')
+        return True
+
+    def find_result(self, expression: str, operation_type: str) -> Optional[str]:
+        """Последний сохранённый результат выражения или None."""
+        try:
+            with DB_SECONDS.time('find_result'):
+                row = self.pool.connection().execute(
+                    _FIND_RESULT, (expression, operation_type)).fetchone()
+            return row[0] if row else None
+        except sqlite3.Error:
+            return None
+
+    def most_frequent(self, limit: int = 200) -> List[Tuple[str, str, str]]:
+        """Самые частые выражения: (expression, operation_type, result)."""
+        try:
+            rows = self.pool.connection().execute(_MOST_FREQUENT, (limit,)).fetchall()
+            # В SQLite result берётся из той же строки, что и MAX(id)
+            return [tuple(row)[:3] for row in rows]
+        except sqlite3.Error:
+            return []
+
+
+class ChangeWatcher:
+    """
+    Обнаруживает изменения истории, сделанные другими соединениями.
+    PRAGMA data_version меняется после фиксации любой транзакции другого
+    соединения, в том числе фонового потока записи этого процесса;
+    повторное чтение счётчика дёшево, поэтому изменения не разделяются
+    на свои и чужие.
+    """
+
+    def __init__(self, history: CalculationHistory) -> None:
+        self.history = history
+        self._version = self._data_version()
+
+    def poll(self) -> bool:
+        """True, если с прошлого вызова базу изменило другое соединение."""
+        version = self._data_version()
+        changed = version != self._version
+        self._version = version
+        return changed
+
+    def _data_version(self) -> Optional[int]:
+        try:
+            return self.history.pool.connection().execute('PRAGMA data_version').fetchone()[0]
+        except sqlite3.Error:
+            return None
+
+
+_STOP = object()
+
+
+class HistoryWriter:
+    """
+    Отложенная запись истории. Пакет записывается, когда набралось
+    batch_size вычислений, прошло interval секунд с первого из них
+    или вызван close(). Если очередь заполнена, submit и submit_many
+    ждут место не дольше put_timeout секунд на весь вызов, а затем
+    отбрасывают оставшиеся записи.
+    """
+
+    def __init__(self, history: CalculationHistory,
+                 maxsize: int = WRITE_QUEUE_SIZE,
+                 batch_size: int = WRITE_BATCH_SIZE,
+                 interval: float = WRITE_INTERVAL,
+                 put_timeout: float = WRITE_PUT_TIMEOUT) -> None:
+        self.history = history
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.interval = interval
+        self.put_timeout = put_timeout
+        self.written = 0
+        self.batches = 0
+        self.failed = 0
+        self.blocked = 0
+        self.dropped = 0
+        self.high_water = 0
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="history-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, expression: str, result: Any, operation_type: str) -> bool:
+        """Ставит вычисление в очередь; False, если запись отброшена."""
+        return self.submit_many([(expression, result, operation_type)])
+
+    def submit_many(self, records: Iterable[Tuple[str, Any, str]]) -> bool:
+        if self._closed:
+            return False
+        accepted = True
+        deadline = None
+        for record in records:
+            if not accepted:
+                # Срок вызова истёк: остаток отбрасывается без ожидания
+                with self._lock:
+                    self.dropped += 1
+                continue
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                with self._lock:
+                    self.blocked += 1
+                if deadline is None:
+                    deadline = time.monotonic() + self.put_timeout
+                try:
+                    self._queue.put(record, timeout=max(deadline - time.monotonic(), 0))
+                except queue.Full:
+                    with self._lock:
+                        self.dropped += 1
+                    accepted = False
+        with self._lock:
+            self.high_water = max(self.high_water, self._queue.qsize())
+        return accepted
+
+    def flush(self) -> None:
+        """Ждёт, пока все поставленные в очередь записи окажутся в базе."""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Записывает остаток очереди и останавливает фоновый поток."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'queued': self._queue.qsize(),
+                'maxsize': self.maxsize,
+                'high_water': self.high_water,
+                'written': self.written,
+                'batches': self.batches,
+                'failed': self.failed,
+                'blocked': self.blocked,
+                'dropped': self.dropped,
+            }
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            batch = []
+            deadline = time.monotonic() + self.interval
+            while item is not _STOP:
+                batch.append(item)
+                timeout = deadline - time.monotonic()
+                if len(batch) >= self.batch_size or timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except Exception as e:
+                # Поток записи не должен останавливаться: иначе flush и close ждут вечно
+                print(f"Ошибка записи истории: {e}")
+                with self._lock:
+                    self.failed += len(batch)
+            finally:
+                for _ in range(len(batch) + (item is _STOP)):
+                    self._queue.task_done()
+            if item is _STOP:
+                return
+
+    def _write(self, batch: List[Tuple[str, Any, str]]) -> None:
+        if not batch:
+            return
+        saved = self.history.save_calculations(batch)
+        with self._lock:
+            if saved:
+                self.written += len(batch)
+                self.batches += 1
+            else:
+                self.failed += len(batch)
+
+
+class AsyncHistory:
+    """
+    Асинхронная обёртка над CalculationHistory и HistoryWriter. Каждый
+    поток пула работает через своё соединение из ConnectionPool.
+    """
+
+    def __init__(self, history: CalculationHistory,
+                 writer: Optional[HistoryWriter] = None,
+                 max_workers: int = ASYNC_DB_THREADS) -> None:
+        self.history = history
+        self.writer = writer
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="history-db")
+
+    async def _run(self, function: Callable[..., Any], *args: Any) -> Any:
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    async def get_calculation_history(self, limit: int = 10,
+                                      before_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        return await self._run(self.history.get_calculation_history, limit, before_id)
+
+    async def get_statistics(self) -> Dict[str, Any]:
+        return await self._run(self.history.get_statistics)
+
+    async def submit(self, expression: str, result: Any, operation_type: str) -> bool:
+        """Ставит вычисление в очередь записи; без writer записывает сразу."""
+        if self.writer is not None:
+            # submit может ждать место в очереди до put_timeout секунд
+            return await self._run(self.writer.submit, expression, result, operation_type)
+        return await self._run(self.history.save_calculation, expression, result, operation_type)
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
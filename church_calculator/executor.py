@@ -0,0 +1,144 @@
+"""
+Выполнение дорогих операций калькулятора Чёрча в отдельных процессах.
+
+Дешёвые операции считаются в текущем потоке, тяжёлые (факториал и степень
+с большим результатом) — в отдельном процессе с жёстким ограничением времени, чтобы не удерживать
+GIL веб-сервера. Каждое тяжёлое вычисление получает свой процесс, поэтому
+тайм-аут или отмена останавливают только его, а не вычисления других
+клиентов.
+"""
+
+import multiprocessing
+import os
+import threading
+import time
+from typing import Any, Callable, Optional, Set
+
+from church import ChurchCalculator
+from cost import INLINE_RESULT_BITS, TooExpensiveError, estimate, estimate_tree
+from symbolic import Expr, church_evaluate
+
+
+# Ограничение времени на одну тяжёлую операцию, секунды
+DEFAULT_TIMEOUT = 5.0
+
+# Как часто проверяется флаг отмены во время ожидания результата, секунды
+CANCEL_POLL_INTERVAL = 0.05
+
+
+class CalculationCancelled(Exception):
+    """Вычисление отменено пользователем."""
+
+
+def compute(operation: str, a: int, b: Optional[int] = None) -> int:
+    """Вычисляет операцию над целыми операндами через числа Чёрча."""
+    church_b = None if b is None else ChurchCalculator.from_int(b)
+    result = ChurchCalculator.evaluate(operation, ChurchCalculator.from_int(a), church_b)
+    return result.to_int()
+
+
+def _child(connection: Any, function: Callable[..., int], args: tuple) -> None:
+    """Тело процесса вычисления: результат или исключение уходят через канал."""
+    try:
+        connection.send((True, function(*args)))
+    except BaseException as e:
+        connection.send((False, e))
+    finally:
+        connection.close()
+
+
+class ChurchExecutor:
+    """
+    Процессы для тяжёлых операций с тайм-аутом и отменой. Одновременно
+    работает не больше max_workers процессов, остальные вычисления ждут
+    очереди в пределах своего тайм-аута.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None,
+                 timeout: float = DEFAULT_TIMEOUT,
+                 inline_bits: int = INLINE_RESULT_BITS) -> None:
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.inline_bits = inline_bits
+        self.started = 0
+        self._slots = threading.BoundedSemaphore(self.max_workers)
+        self._processes: Set[multiprocessing.Process] = set()
+        self._lock = threading.Lock()
+
+    def is_heavy(self, operation: str, a: int, b: Optional[int] = None) -> bool:
+        return estimate(operation, a, b).result_bits > self.inline_bits
+
+    def run(self, operation: str, a: int, b: Optional[int] = None,
+            cancel: Optional[threading.Event] = None) -> int:
+        """
+        Вычисляет операцию через ChurchCalculator.
+        Тяжёлые операции выполняются в отдельном процессе;
+        если результат не получен за timeout секунд, процесс останавливается
+        и выбрасывается TooExpensiveError. Установленный флаг cancel
+        останавливает процесс и выбрасывает CalculationCancelled.
+        """
+        if not self.is_heavy(operation, a, b):
+            return compute(operation, a, b)
+        return self._submit(compute, operation, a, b, cancel=cancel)
+
+    def run_tree(self, tree: Expr, cancel: Optional[threading.Event] = None) -> int:
+        """
+        Вычисляет дерево вложенного выражения операциями ChurchCalculator;
+        тяжёлое дерево целиком уходит в отдельный процесс, как и в run.
+        """
+        if estimate_tree(tree).result_bits <= self.inline_bits:
+            return church_evaluate(tree)
+        return self._submit(church_evaluate, tree, cancel=cancel)
+
+    def _submit(self, function: Callable[..., int], *args: Any,
+                cancel: Optional[threading.Event] = None) -> int:
+        deadline = time.monotonic() + self.timeout
+        while not self._slots.acquire(timeout=self._poll(deadline, cancel)):
+            pass
+        try:
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_child, args=(sender, function, args),
+                                              daemon=True)
+            process.start()
+            sender.close()
+            with self._lock:
+                self._processes.add(process)
+                self.started += 1
+            received = False
+            try:
+                while not receiver.poll(self._poll(deadline, cancel)):
+                    pass
+                ok, value = receiver.recv()
+                received = True
+            except EOFError:
+                raise TooExpensiveError("Вычисление прервано: процесс вычисления завершился аварийно")
+            finally:
+                # Останавливается только процесс этого вычисления
+                if not received:
+                    process.terminate()
+                process.join()
+                receiver.close()
+                with self._lock:
+                    self._processes.discard(process)
+        finally:
+            self._slots.release()
+        if not ok:
+            raise value
+        return value
+
+    def _poll(self, deadline: float, cancel: Optional[threading.Event]) -> float:
+        """Сколько ждать до следующей проверки; отмена и тайм-аут — исключения."""
+        if cancel is not None and cancel.is_set():
+            raise CalculationCancelled("Вычисление отменено")
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TooExpensiveError(
+                f"Вычисление слишком дорогое: не уложилось в {self.timeout:g} с")
+        return remaining if cancel is None else min(remaining, CANCEL_POLL_INTERVAL)
+
+    def shutdown(self) -> None:
+        """Останавливает все выполняющиеся вычисления."""
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            process.terminate()
@@ -0,0 +1,174 @@
+"""
+Разбор арифметических выражений калькулятора Чёрча.
+
+Выражение разбивается на лексемы одним заранее скомпилированным регулярным
+выражением и разбирается за один проход методом Пратта. Результат — дерево
+из узлов symbolic (Num, Add, Sub, Mul, Div, Pow, Fact), которое вычисляется
+движком Чёрча.
+
+Приоритеты: постфиксный ! выше всех, затем ^ (правоассоциативная),
+затем * и /, затем + и -. Поддерживаются скобки: (2+3)*4!^2.
+"""
+
+import re
+from decimal import Decimal
+from typing import List, Optional, Tuple, Union
+
+from symbolic import OPERATIONS, Add, Div, Expr, Fact, Mul, Num, Pow, Sub, church_evaluate
+
+
+UNSUPPORTED = "Неподдерживаемое выражение или некорректный формат"
+
+# Число, оператор или скобка
+_TOKEN = re.compile(r'[0-9]+\.?[0-9]*|[-+*/^!()]')
+
+# Выражение из одной операции над числами разбирается одним сопоставлением
+_SIMPLE = re.compile(r'([0-9]+\.?[0-9]*)(?:([-+*/^])([0-9]+\.?[0-9]*)|!)')
+
+# Лексема конца выражения
+_END = ''
+
+# Наибольшая вложенность скобок и цепочек ^: разбор рекурсивный, и более
+# глубокое выражение исчерпало бы стек интерпретатора
+MAX_DEPTH = 200
+
+# Число в записи пользователя: целое или десятичная дробь
+Number = Union[int, Decimal]
+
+# Сила связывания бинарных операторов: (левая, правая, узел дерева)
+_BINARY = {
+    '+': (10, 11, Add),
+    '-': (10, 11, Sub),
+    '*': (20, 21, Mul),
+    '/': (20, 21, Div),
+    '^': (31, 30, Pow),
+}
+
+class Literal(Num):
+    """
+    Число из текста выражения. Значение — целая часть, прочитанная без
+    перевода в float; text — запись пользователя с дробной частью.
+    """
+
+    __slots__ = ('text',)
+
+    def __init__(self, text: str) -> None:
+        whole = text.partition('.')[0]
+        try:
+            self.operands = (int(whole),)
+        except ValueError:
+            raise ValueError(f"Слишком длинное число: {len(whole)} цифр") from None
+        self.text = text
+
+    @property
+    def fractional(self) -> bool:
+        return self.text.partition('.')[2].strip('0') != ''
+
+    @property
+    def number(self) -> Number:
+        """Число в записи пользователя: int для целых, Decimal для дробных."""
+        return Decimal(self.text) if self.fractional else self.operands[0]
+
+
+def tokenize(expression: str) -> List[str]:
+    """Разбивает нормализованное выражение на лексемы."""
+    tokens = _TOKEN.findall(expression)
+    # Лексемы идут подряд, поэтому любой лишний символ меняет общую длину
+    if sum(map(len, tokens)) != len(expression):
+        raise ValueError(UNSUPPORTED)
+    return tokens
+
+
+def normalize(expression: str) -> str:
+    """Убирает пробелы и заменяет десятичную запятую точкой."""
+    return expression.strip().replace(' ', '').replace(',', '.')
+
+
+def _factorial(node: Expr) -> Fact:
+    if isinstance(node, Literal) and node.fractional:
+        raise ValueError("Факториал определен только для целых чисел")
+    return Fact(node)
+
+
+def _expression(tokens: List[str], pos: int, min_power: int,
+                depth: int = 0) -> Tuple[Expr, int]:
+    """
+    Разбор методом Пратта: выражение, начинающееся с лексемы pos,
+    из операторов с силой связывания не меньше min_power.
+    """
+    if depth > MAX_DEPTH:
+        raise ValueError(UNSUPPORTED)
+    token = tokens[pos]
+    pos += 1
+    if token == '(':
+        left, pos = _expression(tokens, pos, 0, depth + 1)
+        if tokens[pos] != ')':
+            raise ValueError(UNSUPPORTED)
+        pos += 1
+    elif token[:1].isdigit():
+        left = Literal(token)
+    else:
+        raise ValueError(UNSUPPORTED)
+
+    while True:
+        token = tokens[pos]
+        if token == '!':
+            left = _factorial(left)
+            pos += 1
+            continue
+        binding = _BINARY.get(token)
+        if binding is None or binding[0] < min_power:
+            return left, pos
+        right, pos = _expression(tokens, pos + 1, binding[1], depth + 1)
+        left = binding[2](left, right)
+
+
+class ExpressionParser:
+    @staticmethod
+    def parse(expression: str) -> Expr:
+        """Строит дерево выражения."""
+        expression = normalize(expression)
+        match = _SIMPLE.fullmatch(expression)
+        if match:
+            a, operator, b = match.groups()
+            if operator is None:
+                return _factorial(Literal(a))
+            return _BINARY[operator][2](Literal(a), Literal(b))
+
+        tokens = tokenize(expression)
+        tokens.append(_END)
+        tree, pos = _expression(tokens, 0, 0)
+        if pos != len(tokens) - 1:
+            raise ValueError(UNSUPPORTED)
+        return tree
+
+    @staticmethod
+    def as_tuple(tree: Expr) -> Optional[Tuple[str, Number, Optional[Number]]]:
+        """
+        (operation, a, b) для выражения из одной операции над числами,
+        иначе None.
+        """
+        operation = OPERATIONS.get(type(tree))
+        if operation is None or not all(isinstance(a, Literal) for a in tree.operands):
+            return None
+        if operation == 'factorial':
+            return operation, tree.operands[0].number, None
+        return operation, tree.operands[0].number, tree.operands[1].number
+
+    @staticmethod
+    def operation(tree: Expr) -> str:
+        """Имя операции в корне дерева."""
+        return OPERATIONS.get(type(tree), 'number')
+
+    @staticmethod
+    def parse_expression(expression: str) -> tuple:
+        """Разбирает выражение из одной операции в кортеж (operation, a, b)."""
+        parsed = ExpressionParser.as_tuple(ExpressionParser.parse(expression))
+        if parsed is None:
+            raise ValueError(UNSUPPORTED)
+        return parsed
+
+    @staticmethod
+    def evaluate(expression: str) -> int:
+        """Разбирает и вычисляет выражение движком Чёрча."""
+        return church_evaluate(ExpressionParser.parse(expression))
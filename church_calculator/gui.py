@@ -1,183 +1,143 @@
 import sys
-import re
 import os
-import sqlite3
+import threading
 from datetime import datetime
+from itertools import islice
 from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                                QHBoxLayout, QLineEdit, QPushButton, QComboBox, 
                                QLabel, QMessageBox, QGroupBox, QTextEdit, QGridLayout,
-                               QTableWidget, QTableWidgetItem, QTabWidget, QDialog,
-                               QHeaderView, QSplitter, QFrame)
-from PySide6.QtCore import Qt, QTimer
+                               QTableView, QTabWidget, QDialog,
+                               QHeaderView, QSplitter, QFrame, QProgressBar)
+from PySide6.QtCore import (Qt, QTimer, QAbstractTableModel, QModelIndex,
+                            QObject, QRunnable, QThreadPool, Signal)
 from PySide6.QtGui import QFont, QTextCursor, QColor, QBrush
 
-from church import ChurchCalculator, church_to_int, int_to_church
+from calculation import CalculationPipeline
+from database import CalculationHistory, ChangeWatcher, HistoryWriter
+from executor import CalculationCancelled
+from retention import RetentionPolicy
 
 
-class ExpressionParser:
-    @staticmethod
-    def parse_expression(expression: str) -> tuple:
-        expression = expression.strip().replace(' ', '').replace(',', '.')
-        
-        patterns = {
-            'factorial': r'^([0-9]+\.?[0-9]*)!$',
-            'power': r'^([0-9]+\.?[0-9]*)\^([0-9]+\.?[0-9]*)$',
-            'multiply': r'^([0-9]+\.?[0-9]*)\*([0-9]+\.?[0-9]*)$',
-            'divide': r'^([0-9]+\.?[0-9]*)/([0-9]+\.?[0-9]*)$',
-            'add': r'^([0-9]+\.?[0-9]*)\+([0-9]+\.?[0-9]*)$',
-            'subtract': r'^([0-9]+\.?[0-9]*)-([0-9]+\.?[0-9]*)$'
-        }
-        
-        for operation, pattern in patterns.items():
-            match = re.match(pattern, expression)
-            if match:
-                if operation == 'factorial':
-                    return operation, float(match.group(1)), None
-                else:
-                    return operation, float(match.group(1)), float(match.group(2))
-        
-        raise ValueError("Неподдерживаемое выражение или некорректный формат")
+# Как часто проверяются изменения базы из других процессов, мс
+EXTERNAL_CHANGES_INTERVAL = 2000
+
+
+class HistoryNotifier(QObject):
+    """Переносит уведомления хранилища из фоновых потоков в поток интерфейса."""
+    changed = Signal(str, int)
+
+
+class CalculationSignals(QObject):
+    """Сигналы фонового вычисления; доставляются в поток интерфейса."""
+    progress = Signal(int, str)
+    finished = Signal(object, bool)
+    failed = Signal(str)
+    cancelled = Signal()
 
 
-class DatabaseManager:
-    """Менеджер базы данных для истории вычислений."""
+class CalculationWorker(QRunnable):
+    """Вычисление выражения и запись в историю вне потока интерфейса."""
+
+    def __init__(self, pipeline, history_writer, expression: str):
+        super().__init__()
+        self.pipeline = pipeline
+        self.history_writer = history_writer
+        self.expression = expression
+        self.signals = CalculationSignals()
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    def run(self):
+        try:
+            # Числа Чёрча считаются по замкнутым формулам, поэтому ход
+            # вычисления показывается по оценке числа применений f
+            cost = self.pipeline.estimate(self.expression)
+            self.signals.progress.emit(
+                10, f"Вычисление: ≈ 2^{cost.log2_applications:.1f} применений f")
+            calculation = self.pipeline.calculate(self.expression, cancel=self._cancel)
+            self.signals.progress.emit(90, "Сохранение в базу данных")
+            saved = self.history_writer.submit(
+                calculation.expression, calculation.result, calculation.operation)
+            self.signals.progress.emit(100, "Готово")
+            self.signals.finished.emit(calculation, saved)
+        except CalculationCancelled:
+            self.signals.cancelled.emit()
+        except ValueError as e:
+            self.signals.failed.emit(f"Некорректное выражение: {e}")
+        except Exception as e:
+            self.signals.failed.emit(f"Ошибка вычисления: {e}")
+
+
+class HistoryTableModel(QAbstractTableModel):
+    """Модель истории вычислений, подгружающая записи страницами при прокрутке."""
     
-    def __init__(self, db_path="calculator.db"):
-        self.db_path = db_path
-        self._ensure_database()
+    COLUMNS = (("ID", 'id'), ("Выражение", 'expression'), ("Результат", 'result'),
+               ("Операция", 'operation_type'), ("Время", 'timestamp'))
     
-    def _ensure_database(self):
-        """Создает базу данных и таблицы при необходимости."""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS calculations (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    expression TEXT NOT NULL,
-                    result TEXT NOT NULL,
-                    operation_type TEXT NOT NULL,
-                    timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')
-            
-            # Таблица статистики
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS statistics (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    operation_type TEXT NOT NULL,
-                    count INTEGER DEFAULT 0,
-                    last_used DATETIME
-                )
-            ''')
-            
-            conn.commit()
-            conn.close()
-            
-        except sqlite3.Error as e:
-            print(f"Ошибка базы данных: {e}")
+    def __init__(self, db_manager, page_size: int = 100, parent=None):
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self.page_size = page_size
+        self.reload()
     
-    def save_calculation(self, expression: str, result: str, operation_type: str):
-        """Сохраняет вычисление в базу данных."""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            
-            # Сохраняем вычисление
-            cursor.execute('''
-                INSERT INTO calculations (expression, result, operation_type)
-                VALUES (?, ?, ?)
-            ''', (expression, str(result), operation_type))
-            
-            # Обновляем статистику
-            cursor.execute('''
-                INSERT OR REPLACE INTO statistics (operation_type, count, last_used)
-                VALUES (?, 
-                    COALESCE((SELECT count + 1 FROM statistics WHERE operation_type = ?), 1),
-                    CURRENT_TIMESTAMP)
-            ''', (operation_type, operation_type))
-            
-            conn.commit()
-            conn.close()
-            return True
-            
-        except sqlite3.Error as e:
-            print(f"Ошибка сохранения: {e}")
-            return False
+    def reload(self):
+        """Сбрасывает загруженные записи; первая страница читается при показе."""
+        self.beginResetModel()
+        self._rows = []
+        self._source = self.db_manager.iter_calculation_history(self.page_size)
+        self._exhausted = False
+        self.endResetModel()
     
-    def get_calculation_history(self, limit: int = 50):
-        """Получает историю вычислений."""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT * FROM calculations 
-                ORDER BY id DESC 
-                LIMIT ?
-            ''', (limit,))
-            rows = cursor.fetchall()
-            conn.close()
-            return rows
-        except sqlite3.Error:
-            return []
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
     
-    def get_statistics(self):
-        """Получает статистику операций."""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('''
-                SELECT operation_type, COUNT(*) as count 
-                FROM calculations 
-                GROUP BY operation_type 
-                ORDER BY count DESC
-            ''')
-            stats = cursor.fetchall()
-            
-            cursor.execute('SELECT COUNT(*) as total FROM calculations')
-            total = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(DISTINCT operation_type) as types FROM calculations')
-            types = cursor.fetchone()[0]
-            
-            conn.close()
-            return {
-                'stats': stats,
-                'total_calculations': total,
-                'operation_types': types
-            }
-        except sqlite3.Error:
-            return {'stats': [], 'total_calculations': 0, 'operation_types': 0}
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.COLUMNS)
     
-    def clear_history(self):
-        """Очищает историю вычислений."""
-        try:
-            conn = sqlite3.connect(self.db_path)
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM calculations')
-            cursor.execute('DELETE FROM statistics')
-            conn.commit()
-            conn.close()
-            return True
-        except sqlite3.Error:
-            return False
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        return str(self._rows[index.row()][self.COLUMNS[index.column()][1]])
+    
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.COLUMNS[section][0]
+        return None
+    
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and not self._exhausted
+    
+    def fetchMore(self, parent=QModelIndex()):
+        """Читает следующую страницу истории, когда таблица прокручена до конца."""
+        page = list(islice(self._source, self.page_size))
+        if len(page) < self.page_size:
+            self._exhausted = True
+        if page:
+            first = len(self._rows)
+            self.beginInsertRows(QModelIndex(), first, first + len(page) - 1)
+            self._rows.extend(page)
+            self.endInsertRows()
 
 
 class DatabaseViewerDialog(QDialog):
     """Диалоговое окно для просмотра базы данных."""
     
-    def __init__(self, db_manager, parent=None):
+    def __init__(self, db_manager, notifier=None, parent=None):
         super().__init__(parent)
         self.db_manager = db_manager
+        # Записи, ещё стоящие в очереди, появляются по уведомлению об их записи
+        self.notifier = notifier
+        if notifier is not None:
+            notifier.changed.connect(self.on_history_changed)
         self.setWindowTitle("База данных калькулятора")
         self.setMinimumSize(800, 600)
         self.setStyleSheet("""
             QDialog {
                 background: #f8f9fa;
             }
-            QTableWidget {
+            QTableView {
                 background: white;
                 border: 1px solid #dee2e6;
                 border-radius: 6px;
@@ -259,9 +219,9 @@ class DatabaseViewerDialog(QDialog):
         layout.addWidget(info_frame)
         
         # Таблица с историей вычислений
-        self.history_table = QTableWidget()
-        self.history_table.setColumnCount(5)
-        self.history_table.setHorizontalHeaderLabels(["ID", "Выражение", "Результат", "Операция", "Время"])
+        self.history_model = HistoryTableModel(self.db_manager, parent=self)
+        self.history_table = QTableView()
+        self.history_table.setModel(self.history_model)
         self.history_table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
         layout.addWidget(self.history_table)
         
@@ -291,29 +251,30 @@ class DatabaseViewerDialog(QDialog):
     
     def load_data(self):
         """Загружает данные из базы."""
-        # Загрузка истории
-        history = self.db_manager.get_calculation_history()
-        self.history_table.setRowCount(len(history))
-        
-        for row_idx, record in enumerate(history):
-            self.history_table.setItem(row_idx, 0, QTableWidgetItem(str(record['id'])))
-            self.history_table.setItem(row_idx, 1, QTableWidgetItem(record['expression']))
-            self.history_table.setItem(row_idx, 2, QTableWidgetItem(record['result']))
-            self.history_table.setItem(row_idx, 3, QTableWidgetItem(record['operation_type']))
-            self.history_table.setItem(row_idx, 4, QTableWidgetItem(record['timestamp']))
+        # История подгружается страницами по мере прокрутки
+        self.history_model.reload()
         
         # Загрузка статистики для информации
         stats_data = self.db_manager.get_statistics()
         
         # Обновляем информацию
-        file_size = os.path.getsize("calculator.db") if os.path.exists("calculator.db") else 0
+        db_path = self.db_manager.db_path
+        file_size = os.path.getsize(db_path) if os.path.exists(db_path) else 0
         self.db_info_label.setText(
-            f"База данных: {len(history)} записей | "
-            f"{stats_data['total_calculations']} всего вычислений | "
+            f"База данных: {stats_data['total_calculations']} всего вычислений | "
             f"{stats_data['operation_types']} типов операций | "
             f"{file_size} байт"
         )
     
+    def on_history_changed(self, event: str, count: int):
+        self.load_data()
+    
+    def done(self, result):
+        if self.notifier is not None:
+            self.notifier.changed.disconnect(self.on_history_changed)
+            self.notifier = None
+        super().done(result)
+    
     def clear_history(self):
         """Очищает историю вычислений."""
         reply = QMessageBox.question(
@@ -335,7 +296,21 @@ class CalculatorWindow(QMainWindow):
     
     def __init__(self):
         super().__init__()
-        self.db_manager = DatabaseManager()  # Создаем менеджер БД
+        self.db_manager = CalculationHistory()  # Общее с веб-версией хранилище
+        self.history_writer = HistoryWriter(self.db_manager)  # Запись в фоновом потоке
+        self.retention = RetentionPolicy(self.db_manager)  # Архивирование старой истории
+        self.retention.start()
+        # Счётчик вычислений обновляется только при изменении истории
+        self.history_notifier = HistoryNotifier()
+        self._history_listener = self.history_notifier.changed.emit
+        self.db_manager.subscribe(self._history_listener)
+        # Уже вычислявшиеся выражения берутся из истории
+        self.pipeline = CalculationPipeline(store=self.db_manager)
+        self.pipeline.warm()
+        # Вычисления идут в отдельном потоке, по одному за раз
+        self.thread_pool = QThreadPool(self)
+        self.thread_pool.setMaxThreadCount(1)
+        self.worker = None
         self.init_ui()
         
     def init_ui(self):
@@ -379,6 +354,11 @@ class CalculatorWindow(QMainWindow):
         """)
         header_layout.addWidget(title_label)
         
+        # Счётчик вычислений в базе
+        self.db_counter_label = QLabel()
+        self.db_counter_label.setStyleSheet("font-size: 11px; color: #6c757d;")
+        header_layout.addWidget(self.db_counter_label, alignment=Qt.AlignRight)
+        
         # Кнопка просмотра базы данных
         self.db_button = QPushButton("База данных")
         self.db_button.setFixedSize(100, 35)  # Уменьшили размер
@@ -473,6 +453,7 @@ class CalculatorWindow(QMainWindow):
                     }
                 """)
                 btn.clicked.connect(self.calculate)
+                self.equals_btn = btn
             elif text in ['0', '1', '2', '3', '4', '5', '6', '7', '8', '9', '.']:           
                 btn.setStyleSheet("""
                     QPushButton {
@@ -585,6 +566,48 @@ class CalculatorWindow(QMainWindow):
         """)
         self.result_display.setFixedHeight(60)
         layout.addWidget(self.result_display)
+
+        # Ход вычисления и отмена
+        progress_layout = QHBoxLayout()
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFixedHeight(24)
+        self.progress_bar.setStyleSheet("""
+            QProgressBar {
+                background: #fffafa;
+                border: 2px solid #ffb6c1;
+                border-radius: 8px;
+                font-size: 11px;
+                color: #6c757d;
+                text-align: center;
+            }
+            QProgressBar::chunk {
+                background: #ff85a2;
+                border-radius: 6px;
+            }
+        """)
+        progress_layout.addWidget(self.progress_bar)
+
+        self.cancel_btn = QPushButton("Отмена")
+        self.cancel_btn.setFixedSize(90, 24)
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.setStyleSheet("""
+            QPushButton {
+                background: #fffafa;
+                border: 2px solid #ff69b4;
+                border-radius: 8px;
+                color: #ff1493;
+                font-weight: bold;
+            }
+            QPushButton:disabled {
+                border-color: #ffd1dc;
+                color: #ffb6c1;
+            }
+        """)
+        self.cancel_btn.clicked.connect(self.cancel_calculation)
+        progress_layout.addWidget(self.cancel_btn)
+        layout.addLayout(progress_layout)
         
         # Поле для отображения ошибок
         self.error_display = QTextEdit()
@@ -604,10 +627,14 @@ class CalculatorWindow(QMainWindow):
         """)
         layout.addWidget(self.error_display)
         
-        # Таймер для обновления (оставил для совместимости)
-        self.timer = QTimer()
-        self.timer.timeout.connect(self.update_db_counter)
-        self.timer.start(5000)
+        # Изменения из этого процесса приходят сигналом, из других
+        # процессов — по редкой проверке PRAGMA data_version
+        self.history_notifier.changed.connect(self.update_db_counter)
+        self.change_watcher = ChangeWatcher(self.db_manager)
+        self.timer = QTimer(self)
+        self.timer.timeout.connect(self.check_external_changes)
+        self.timer.start(EXTERNAL_CHANGES_INTERVAL)
+        self.update_db_counter()
         
     def insert_text(self, text: str):
         current_text = self.expression_input.text()
@@ -630,92 +657,69 @@ class CalculatorWindow(QMainWindow):
             self.expression_input.setCursorPosition(cursor_position - 1)
     
     def calculate(self):
-        """Выполняет вычисление на основе введенного выражения."""
-        try:
-            expression = self.expression_input.text().strip()
-            if not expression:
-                self.show_error("Введите математическое выражение")
-                return
-            
-            # Очищаем предыдущие сообщения
-            self.error_display.clear()
-            
-            # Парсинг выражения
-            parsed = ExpressionParser.parse_expression(expression)
-            operation = parsed[0]
-            
-            result = None
-            
-            if operation == 'factorial':
-                n = parsed[1]
-                
-                # Для факториала - только целые числа
-                if n != int(n):
-                    raise ValueError("Факториал определен только для целых чисел")
-                
-                # Преобразование в церковное число
-                church_n = int_to_church(int(n))
-                
-                # Вычисление факториала
-                result_church = ChurchCalculator.factorial(church_n)
-                result = church_to_int(result_church)
-                
-            else:
-                a, b = parsed[1], parsed[2]
-                
-                # Для церковных чисел - только целые части
-                int_a, int_b = int(a), int(b)
-                
-                # Проверка для вычитания
-                if operation == 'subtract' and int_a < int_b:
-                    self.show_info(f"Внимание: уменьшаемое меньше вычитаемого. Результат будет 0.")
-                    result = 0
-                else:
-                    # Преобразование в церковные числа
-                    church_a = int_to_church(int_a)
-                    church_b = int_to_church(int_b)
-                    
-                    # Выполнение операции
-                    if operation == 'add':
-                        result_church = ChurchCalculator.add(church_a, church_b)
-                        result = church_to_int(result_church)
-                        
-                    elif operation == 'subtract':
-                        result_church = ChurchCalculator.subtract(church_a, church_b)
-                        result = church_to_int(result_church)
-                        
-                    elif operation == 'multiply':
-                        result_church = ChurchCalculator.multiply(church_a, church_b)
-                        result = church_to_int(result_church)
-                        
-                    elif operation == 'divide':
-                        # Целочисленное деление
-                        if int_b == 0:
-                            raise ValueError("Деление на ноль")
-                        result = int_a // int_b
-                        
-                    elif operation == 'power':
-                        result_church = ChurchCalculator.power(church_a, church_b)
-                        result = church_to_int(result_church)
-            
-            # Отображение финального результата
-            self.result_display.setText(str(result))
-            
-            # Сохраняем в базу данных
-            if result is not None:
-                success = self.db_manager.save_calculation(expression, str(result), operation)
-                if success:
-                    self.show_info(f"Вычисление сохранено в базу данных")
-                else:
-                    self.show_info(f"Не удалось сохранить в базу данных")
-            
-        except ValueError as e:
-            error_msg = str(e)
-            self.show_error(f"Некорректное выражение: {error_msg}")
-        except Exception as e:
-            error_msg = str(e)
-            self.show_error(f"Ошибка вычисления: {error_msg}")
-    
+        """Запускает вычисление введенного выражения в фоновом потоке."""
+        if self.worker is not None:
+            return
+        expression = self.expression_input.text().strip()
+        if not expression:
+            self.show_error("Введите математическое выражение")
+            return
+
+        # Очищаем предыдущие сообщения
+        self.error_display.clear()
+
+        # Разбор, вычисление и запись в базу данных идут вне потока интерфейса
+        self.worker = CalculationWorker(self.pipeline, self.history_writer, expression)
+        self.worker.signals.progress.connect(self.on_progress)
+        self.worker.signals.finished.connect(self.on_calculated)
+        self.worker.signals.failed.connect(self.on_failed)
+        self.worker.signals.cancelled.connect(self.on_cancelled)
+        self.set_busy(True)
+        self.thread_pool.start(self.worker)
+
+    def cancel_calculation(self):
+        """Отменяет текущее вычисление."""
+        if self.worker is not None:
+            self.worker.cancel()
+            self.progress_bar.setFormat("Отмена...")
+
+    def set_busy(self, busy: bool):
+        self.equals_btn.setEnabled(not busy)
+        self.cancel_btn.setEnabled(busy)
+        if busy:
+            self.progress_bar.setValue(0)
+            self.progress_bar.setFormat("Разбор выражения")
+        else:
+            self.worker = None
+
+    def on_progress(self, value: int, message: str):
+        self.progress_bar.setValue(value)
+        self.progress_bar.setFormat(message)
+
+    def on_calculated(self, calculation, saved: bool):
+        self.set_busy(False)
+        if calculation.warning:
+            self.show_info(calculation.warning)
+
+        # Отображение финального результата
+        self.result_display.setText(str(calculation.result))
+        if saved:
+            self.show_info(f"Вычисление сохранено в базу данных")
+        else:
+            self.show_info(f"Не удалось сохранить в базу данных")
+
+    def on_failed(self, message: str):
+        self.set_busy(False)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("")
+        self.show_error(message)
+
+    def on_cancelled(self):
+        self.set_busy(False)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("Отменено")
+        self.show_info("Вычисление отменено")
+
     def show_error(self, message: str):
         """Показывает сообщение об ошибке."""
         self.result_display.setText("Ошибка")
@@ -754,12 +758,31 @@ class CalculatorWindow(QMainWindow):
     
     def show_database(self):
         """Показывает окно базы данных."""
-        dialog = DatabaseViewerDialog(self.db_manager, self)
+        # Окно открывается сразу, без ожидания очереди записи
+        dialog = DatabaseViewerDialog(self.db_manager, self.history_notifier, self)
         dialog.exec()
     
-    def update_db_counter(self):
-        """Оставлен для совместимости, но не используется."""
-        pass
+    def update_db_counter(self, event: str = '', count: int = 0):
+        """Показывает число вычислений в базе; вызывается при изменении истории."""
+        total = self.db_manager.get_statistics()['total_calculations']
+        self.db_counter_label.setText(f"Вычислений: {total}")
+    
+    def check_external_changes(self):
+        """Обновляет счётчик, если базу изменило другое соединение или процесс."""
+        if self.change_watcher.poll():
+            self.update_db_counter('external')
+    
+    def closeEvent(self, event):
+        """Записывает остаток очереди истории перед закрытием окна."""
+        if self.worker is not None:
+            self.worker.cancel()
+        self.thread_pool.waitForDone()
+        self.timer.stop()
+        self.db_manager.unsubscribe(self._history_listener)
+        self.retention.stop()
+        self.history_writer.close()
+        self.db_manager.close()
+        super().closeEvent(event)
 
 
 def main():
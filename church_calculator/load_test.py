@@ -0,0 +1,160 @@
+"""
+Нагрузочный тест веб-версии калькулятора Чёрча в духе locust.
+
+Каждый виртуальный пользователь в своём потоке выбирает задачу по весу,
+отправляет запрос и делает паузу. В конце печатается сводка по каждому
+запросу: число запросов и ошибок, запросов в секунду и перцентили времени
+ответа.
+
+    python serve.py --workers 4 --bind 127.0.0.1:5000
+    python load_test.py --host http://127.0.0.1:5000 --users 50 --duration 60
+"""
+
+import argparse
+import json
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+
+class Stats:
+    """Время ответа и ошибки по именам запросов."""
+
+    def __init__(self) -> None:
+        self.times: Dict[str, List[float]] = defaultdict(list)
+        self.failures: Dict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def record(self, name: str, elapsed: float, ok: bool) -> None:
+        with self._lock:
+            self.times[name].append(elapsed)
+            if not ok:
+                self.failures[name] += 1
+
+    def report(self, duration: float) -> str:
+        lines = [f"{'Запрос':<22}{'всего':>8}{'ошибок':>8}{'в сек':>8}"
+                 f"{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}"]
+        for name in sorted(self.times):
+            times = sorted(self.times[name])
+            lines.append(f"{name:<22}{len(times):>8}{self.failures[name]:>8}"
+                         f"{len(times) / duration:>8.1f}"
+                         f"{percentile(times, 50):>10.1f}{percentile(times, 95):>10.1f}"
+                         f"{percentile(times, 99):>10.1f}")
+        total = sum(len(times) for times in self.times.values())
+        failed = sum(self.failures.values())
+        lines.append(f"{'Итого':<22}{total:>8}{failed:>8}{total / duration:>8.1f}")
+        return '\n'.join(lines)
+
+
+def percentile(times: List[float], p: float) -> float:
+    """Перцентиль отсортированных времён ответа в миллисекундах."""
+    if not times:
+        return 0.0
+    if len(times) == 1:
+        return times[0] * 1000
+    return statistics.quantiles(times, n=100, method='inclusive')[int(p) - 1] * 1000
+
+
+class CalculatorUser:
+    """Виртуальный пользователь: задачи с весами и пауза между запросами."""
+
+    def __init__(self, host: str, stats: Stats, wait: Tuple[float, float]) -> None:
+        self.host = host.rstrip('/')
+        self.stats = stats
+        self.wait = wait
+        self.tasks = [
+            (self.calculate_popular, 5),
+            (self.calculate_new, 3),
+            (self.calculate_batch, 1),
+            (self.history, 2),
+            (self.health, 1),
+        ]
+
+    def calculate_popular(self) -> None:
+        """Частые выражения: ответ из кэша."""
+        expression = random.choice(['2+3', '10*10', '5!', '2^10', '100/7', '7-9'])
+        self.request('POST /calculate', '/calculate', {'expression': expression})
+
+    def calculate_new(self) -> None:
+        a, b = random.randint(1, 10 ** 6), random.randint(1, 1000)
+        expression = random.choice([f'{a}+{b}', f'{a}*{b}', f'{a}/{b}', f'{b}!', f'2^{b}'])
+        self.request('POST /calculate', '/calculate', {'expression': expression})
+
+    def calculate_batch(self) -> None:
+        expressions = [f'{random.randint(1, 1000)}+{random.randint(1, 1000)}' for _ in range(20)]
+        self.request('POST /calculate/batch', '/calculate/batch', {'expressions': expressions})
+
+    def history(self) -> None:
+        self.request('GET /history', '/history?limit=50')
+
+    def health(self) -> None:
+        self.request('GET /health', '/health')
+
+    def request(self, name: str, path: str, payload: Optional[dict] = None) -> None:
+        data = None if payload is None else json.dumps(payload).encode('utf-8')
+        request = urllib.request.Request(self.host + path, data=data,
+                                         headers={'Content-Type': 'application/json'})
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                ok = response.status == 200
+        except urllib.error.HTTPError as e:
+            # Отклонённые дорогие выражения — ожидаемый ответ, а не сбой
+            ok = e.code == 422
+        except (urllib.error.URLError, OSError):
+            ok = False
+        self.stats.record(name, time.perf_counter() - start, ok)
+
+    def run(self, stop: threading.Event) -> None:
+        functions = [task for task, _ in self.tasks]
+        weights = [weight for _, weight in self.tasks]
+        while not stop.is_set():
+            random.choices(functions, weights)[0]()
+            stop.wait(random.uniform(*self.wait))
+
+
+def run(host: str, users: int, duration: float, spawn_rate: float,
+        wait: Tuple[float, float]) -> Stats:
+    """Запускает users пользователей по spawn_rate в секунду на duration секунд."""
+    stats = Stats()
+    stop = threading.Event()
+    threads = []
+    start = time.monotonic()
+    for i in range(users):
+        if stop.wait(i / spawn_rate - (time.monotonic() - start)):
+            break
+        thread = threading.Thread(target=CalculatorUser(host, stats, wait).run,
+                                  args=(stop,), daemon=True)
+        thread.start()
+        threads.append(thread)
+    stop.wait(max(0.0, duration - (time.monotonic() - start)))
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return stats
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Нагрузочный тест калькулятора Чёрча")
+    parser.add_argument('--host', default='http://127.0.0.1:5000')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--spawn-rate', type=float, default=10.0,
+                        help="сколько пользователей запускать в секунду")
+    parser.add_argument('--duration', type=float, default=30.0, help="секунды")
+    parser.add_argument('--wait', type=float, nargs=2, default=(0.1, 0.5),
+                        metavar=('MIN', 'MAX'), help="пауза между запросами, секунды")
+    args = parser.parse_args()
+
+    print(f"Нагрузка на {args.host}: {args.users} пользователей, {args.duration:g} с")
+    stats = run(args.host, args.users, args.duration, args.spawn_rate, tuple(args.wait))
+    print(stats.report(args.duration))
+
+
+if __name__ == '__main__':
+    main()
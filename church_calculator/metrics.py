@@ -0,0 +1,193 @@
+"""
+Метрики калькулятора Чёрча в текстовом формате Prometheus.
+
+Счётчики и гистограммы хранятся в памяти процесса и отдаются веб-версией
+по /metrics. Время разбора и вычисления записывает CalculationPipeline,
+время операций над числами — ChurchCalculator через operation_hooks,
+время запросов к истории — CalculationHistory. В рабочем режиме с
+несколькими процессами каждый процесс отдаёт свои значения.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import church
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Границы корзин гистограмм времени, секунды
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[str, ...]
+
+
+def _labels(names: Sequence[str], values: Labels, extra: str = '') -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Registry:
+    """Набор метрик, которые отдаются одним ответом."""
+
+    def __init__(self) -> None:
+        self._metrics: Dict[str, "Metric"] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: "Metric") -> None:
+        with self._lock:
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Registry = REGISTRY) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        registry.register(self)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Монотонно растущий счётчик."""
+    kind = 'counter'
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        return [f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}'
+                for labels, value in values]
+
+
+class Gauge(Metric):
+    """Значения, которые считываются функцией collect в момент запроса метрик."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 collect: Callable[[], Dict[Labels, float]], **kwargs) -> None:
+        super().__init__(name, documentation, labelnames, **kwargs)
+        self.collect = collect
+
+    def samples(self) -> List[str]:
+        return [f'{self.name}{_labels(self.labelnames, labels)} {_number(value)}'
+                for labels, value in sorted(self.collect().items())]
+
+
+class Histogram(Metric):
+    """Распределение значений по корзинам с суммой и числом наблюдений."""
+    kind = 'histogram'
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # Для каждого набора меток: число попаданий в корзины, сумма, количество
+        self._values: Dict[Labels, List] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def count(self, *labels: str) -> int:
+        entry = self._values.get(labels)
+        return entry[2] if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = sorted((labels, (list(entry[0]), entry[1], entry[2]))
+                            for labels, entry in self._values.items())
+        lines = []
+        for labels, (counts, total, count) in values:
+            cumulative = 0
+            for bound, hits in zip(self.buckets + (float('inf'),), counts):
+                cumulative += hits
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                bucket = _labels(self.labelnames, labels, f'le="{le}"')
+                lines.append(f'{self.name}_bucket{bucket} {cumulative}')
+            lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}')
+            lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+PARSE_SECONDS = Histogram('church_parse_seconds', 'Время разбора выражения')
+EVALUATE_SECONDS = Histogram('church_evaluate_seconds',
+                             'Время вычисления выражения по операциям', ('operation',))
+OPERATION_SECONDS = Histogram('church_operation_seconds',
+                              'Время операций ChurchCalculator над числами', ('operation',))
+DB_SECONDS = Histogram('church_db_seconds', 'Время запросов к истории вычислений', ('query',))
+ERRORS = Counter('church_errors_total', 'Ошибки разбора и вычисления', ('kind',))
+REJECTED = Counter('church_rejected_total', 'Отклонённые слишком дорогие выражения')
+
+church.operation_hooks.append(lambda operation, seconds: OPERATION_SECONDS.observe(seconds, operation))
+
+
+def register_pipeline(pipeline: Any, writer: Callable[[], Optional[Any]] = lambda: None) -> None:
+    """Показатели кэша выражений и очереди записи истории, снимаемые при запросе метрик."""
+    def cache() -> Dict[Labels, float]:
+        return {(name,): value for name, value in pipeline.stats().items()}
+
+    def hit_ratio() -> Dict[Labels, float]:
+        stats = pipeline.stats()
+        lookups = stats['hits'] + stats['misses']
+        return {(): stats['hits'] / lookups if lookups else 0.0}
+
+    def history_queue() -> Dict[Labels, float]:
+        current = writer()
+        return {} if current is None else {(name,): value for name, value in current.stats().items()}
+
+    Gauge('church_cache', 'Состояние кэша выражений', ('stat',), cache)
+    Gauge('church_cache_hit_ratio', 'Доля попаданий в кэш выражений', (), hit_ratio)
+    Gauge('church_history_queue', 'Очередь записи истории', ('stat',), history_queue)
@@ -0,0 +1,180 @@
+"""
+Хранение и сжатие истории вычислений калькулятора Чёрча.
+
+Вычисления старше keep_days дней сворачиваются в дневные итоги по типам
+операций (таблица daily_statistics), сами строки переносятся в сжатый
+архив JSON Lines и удаляются из calculations. Счётчики statistics при этом
+не уменьшаются, поэтому get_statistics по-прежнему учитывает все
+вычисления. Освободившиеся страницы возвращаются через incremental_vacuum,
+а если база ещё не переведена в auto_vacuum=INCREMENTAL — одним VACUUM.
+"""
+
+import gzip
+import json
+import os
+import threading
+from datetime import datetime, timedelta, timezone
+from itertools import chain
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from database import CalculationHistory
+
+
+# Сколько дней хранить вычисления целиком
+KEEP_DAYS = 30
+
+# Как часто запускать обслуживание, секунды
+RETENTION_INTERVAL = 24 * 60 * 60
+
+# Доля свободных страниц, после которой база сжимается
+VACUUM_FREE_RATIO = 0.25
+
+_TIMESTAMP = '%Y-%m-%d %H:%M:%S'
+
+_ROLL_UP = '''
+    INSERT INTO daily_statistics (day, operation_type, count)
+    SELECT date(timestamp), operation_type, COUNT(*)
+    FROM calculations
+    WHERE timestamp < ?
+    GROUP BY date(timestamp), operation_type
+    ON CONFLICT (day, operation_type) DO UPDATE
+    SET count = count + excluded.count
+'''
+_ARCHIVED_TOTALS = '''
+    SELECT operation_type, COUNT(*), MAX(timestamp)
+    FROM calculations
+    WHERE timestamp < ?
+    GROUP BY operation_type
+'''
+# Возвращает счётчики, уменьшенные триггером statistics_on_delete
+_RESTORE_TOTALS = '''
+    INSERT INTO statistics (operation_type, count, last_used)
+    VALUES (?, ?, ?)
+    ON CONFLICT (operation_type) DO UPDATE
+    SET count = count + excluded.count,
+        last_used = MAX(COALESCE(last_used, ''), excluded.last_used)
+'''
+
+
+class RetentionReport(NamedTuple):
+    """Итог одного прохода обслуживания."""
+    archived: int
+    archive_path: Optional[str]
+    vacuum: Optional[str]
+
+
+class RetentionPolicy:
+    """Правила хранения истории и их применение по расписанию."""
+
+    def __init__(self, history: CalculationHistory, keep_days: int = KEEP_DAYS,
+                 archive_dir: Optional[str] = None,
+                 vacuum_free_ratio: float = VACUUM_FREE_RATIO) -> None:
+        self.history = history
+        self.keep_days = keep_days
+        self.archive_dir = archive_dir or os.path.join(
+            os.path.dirname(os.path.abspath(history.db_path)), 'archive')
+        self.vacuum_free_ratio = vacuum_free_ratio
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+        # Расписание меняется под своей блокировкой, чтобы stop не ждал прохода
+        self._schedule_lock = threading.Lock()
+        self._stopped = threading.Event()
+
+    def run(self, now: Optional[datetime] = None) -> RetentionReport:
+        """Архивирует старые вычисления и при необходимости сжимает базу."""
+        now = now or datetime.now(timezone.utc)
+        # CURRENT_TIMESTAMP в SQLite — время UTC в виде текста
+        cutoff = (now - timedelta(days=self.keep_days)).strftime(_TIMESTAMP)
+        with self._lock:
+            archived, path = self._archive(cutoff, now)
+            vacuum = self._vacuum() if archived else None
+        if archived:
+            self.history.notify('archive', archived)
+        return RetentionReport(archived, path, vacuum)
+
+    def daily_totals(self) -> List[Tuple[str, str, int]]:
+        """Дневные итоги архивированных вычислений: (day, operation_type, count)."""
+        rows = self.history.pool.connection().execute(
+            'SELECT day, operation_type, count FROM daily_statistics ORDER BY day, operation_type')
+        return [tuple(row) for row in rows]
+
+    def start(self, interval: float = RETENTION_INTERVAL) -> None:
+        """Запускает обслуживание каждые interval секунд в фоновом потоке."""
+        with self._schedule_lock:
+            self._stopped.clear()
+            self._schedule(interval)
+
+    def stop(self) -> None:
+        """Отменяет следующий запуск; идущий проход доработает, но не перезапустится."""
+        with self._schedule_lock:
+            self._stopped.set()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+    def _schedule(self, interval: float) -> None:
+        def tick() -> None:
+            try:
+                self.run()
+            except Exception as e:
+                print(f"Ошибка обслуживания истории: {e}")
+            finally:
+                # Каждый запуск идёт в новом потоке Timer: его соединение больше не понадобится
+                self.history.pool.release()
+            with self._schedule_lock:
+                if not self._stopped.is_set():
+                    self._schedule(interval)
+
+        self._timer = threading.Timer(interval, tick)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _archive(self, cutoff: str, now: datetime) -> Tuple[int, Optional[str]]:
+        conn = self.history.pool.connection()
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            rows = conn.execute(
+                'SELECT * FROM calculations WHERE timestamp < ? ORDER BY id', (cutoff,))
+            first = rows.fetchone()
+            if first is None:
+                return 0, None
+
+            os.makedirs(self.archive_dir, exist_ok=True)
+            path = os.path.join(self.archive_dir,
+                                f"calculations-{now.strftime('%Y%m%d-%H%M%S')}.jsonl.gz")
+            archived = 0
+            with open(path, 'wb') as raw:
+                with gzip.GzipFile(fileobj=raw, mode='wb') as archive:
+                    for row in chain([first], rows):
+                        archive.write(json.dumps(dict(row), ensure_ascii=False).encode('utf-8'))
+                        archive.write(b'\n')
+                        archived += 1
+                # Архив должен оказаться на диске до удаления строк из базы
+                raw.flush()
+                os.fsync(raw.fileno())
+
+            totals = conn.execute(_ARCHIVED_TOTALS, (cutoff,)).fetchall()
+            conn.execute(_ROLL_UP, (cutoff,))
+            conn.execute('DELETE FROM calculations WHERE timestamp < ?', (cutoff,))
+            conn.executemany(_RESTORE_TOTALS, [tuple(row) for row in totals])
+        return archived, path
+
+    def _vacuum(self) -> Optional[str]:
+        conn = self.history.pool.connection()
+        if conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            conn.execute('PRAGMA incremental_vacuum').fetchall()
+            return 'incremental'
+        pages = conn.execute('PRAGMA page_count').fetchone()[0]
+        free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if not pages or free / pages < self.vacuum_free_ratio:
+            return None
+        # Переход на incremental возможен только вместе с полным VACUUM
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        return 'full'
+
+
+def read_archive(path: str) -> List[Dict[str, object]]:
+    """Читает вычисления из архивного файла."""
+    with gzip.open(path, 'rt', encoding='utf-8') as archive:
+        return [json.loads(line) for line in archive]
@@ -0,0 +1,109 @@
+"""
+Рабочий режим веб-версии калькулятора Чёрча.
+
+Приложение запускается под gunicorn в нескольких процессах. Движок,
+разборщик и кэш частых выражений загружаются в главном процессе до fork,
+поэтому рабочие процессы делят эту память по copy-on-write. Фоновые потоки
+истории и соединения с базой главный процесс закрывает перед fork, а каждый
+рабочий процесс открывает заново.
+
+    python serve.py --workers 4 --bind 0.0.0.0:5000
+    python serve.py --reload
+
+--reload посылает главному процессу SIGHUP: gunicorn запускает новые
+рабочие процессы и плавно останавливает старые, дожидаясь текущих
+запросов. Новую версию кода загружает SIGUSR2 (второй главный процесс)
+с последующим SIGQUIT старому.
+"""
+
+import argparse
+import multiprocessing
+import os
+import signal
+import sys
+
+
+# Число рабочих процессов по умолчанию
+DEFAULT_WORKERS = int(os.environ.get('CHURCH_WEB_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+
+# Потоков на рабочий процесс: запросы ждут процессы вычислений и SQLite, а не CPU
+DEFAULT_THREADS = int(os.environ.get('CHURCH_WEB_THREADS', 4))
+
+DEFAULT_BIND = os.environ.get('CHURCH_WEB_BIND', '0.0.0.0:5000')
+DEFAULT_PIDFILE = os.environ.get('CHURCH_WEB_PIDFILE', 'church_web.pid')
+
+# Тяжёлые операции ограничены тайм-аутом исполнителя, этого хватает с запасом
+WORKER_TIMEOUT = 30
+GRACEFUL_TIMEOUT = 30
+
+
+def when_ready(server):
+    """Главный процесс только управляет рабочими: его потоки и соединения закрываются."""
+    import church_web
+    church_web.stop_services()
+
+
+def post_fork(server, worker):
+    import church_web
+    church_web.start_services()
+
+
+def options(args: argparse.Namespace) -> dict:
+    """Настройки gunicorn для рабочего режима."""
+    return {
+        'bind': args.bind,
+        'workers': args.workers,
+        'worker_class': 'gthread',
+        'threads': args.threads,
+        'preload_app': True,
+        'timeout': WORKER_TIMEOUT,
+        'graceful_timeout': GRACEFUL_TIMEOUT,
+        'pidfile': args.pidfile,
+        'when_ready': when_ready,
+        'post_fork': post_fork,
+    }
+
+
+def reload(pidfile: str) -> None:
+    """Плавно перезапускает рабочие процессы запущенного сервера."""
+    with open(pidfile) as f:
+        pid = int(f.read().strip())
+    os.kill(pid, signal.SIGHUP)
+    print(f"Рабочие процессы сервера {pid} перезапускаются")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Рабочий режим веб-версии калькулятора Чёрча")
+    parser.add_argument('--bind', default=DEFAULT_BIND)
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS)
+    parser.add_argument('--pidfile', default=DEFAULT_PIDFILE)
+    parser.add_argument('--reload', action='store_true',
+                        help="плавно перезапустить рабочие процессы запущенного сервера")
+    args = parser.parse_args()
+
+    if args.reload:
+        reload(args.pidfile)
+        return
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        print("Ошибка: для рабочего режима нужен gunicorn (pip install gunicorn)")
+        sys.exit(1)
+
+    class ChurchApplication(BaseApplication):
+        def load_config(self):
+            for key, value in options(args).items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            from church_web import app
+            return app
+
+    print(f"Запуск калькулятора Чёрча: {args.bind}, процессов: {args.workers}")
+    ChurchApplication().run()
+
+
+if __name__ == '__main__':
+    main()
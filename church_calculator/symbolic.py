@@ -0,0 +1,346 @@
+"""
+Символьное представление арифметики Чёрча.
+
+Операции строят дерево выражения (Zero, Succ, Pred, Add, Sub, Mul, Div, Pow, Fact),
+которое упрощается и сворачивается в константы ещё до вычисления.
+λ-семантика используется только при применении числа к произвольной функции.
+
+Дерево разбора калькулятора состоит из тех же узлов и вычисляется
+church_evaluate — операциями ChurchCalculator над каждым узлом.
+"""
+
+import math
+from typing import Any, Callable, Dict, Tuple
+
+from church import ChurchCalculator, ChurchNumeral
+
+
+class Expr:
+    """Узел дерева выражения."""
+
+    __slots__ = ('operands',)
+
+    def __init__(self, *operands: Any) -> None:
+        self.operands: Tuple[Any, ...] = operands
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({', '.join(map(repr, self.operands))})"
+
+    @staticmethod
+    def compute(*values: int) -> int:
+        """Значение операции по значениям операндов; задаётся в узлах операций."""
+        raise NotImplementedError
+
+
+class Num(Expr):
+    """Константа — число, значение которого уже известно."""
+
+    @property
+    def value(self) -> int:
+        return self.operands[0]
+
+
+class Zero(Num):
+    def __init__(self) -> None:
+        super().__init__(0)
+
+
+class Term(Expr):
+    """Лист с произвольным λ-термом, значение которого ещё не вычислено."""
+
+    @property
+    def numeral(self) -> ChurchNumeral:
+        return self.operands[0]
+
+
+class Succ(Expr):
+    compute = staticmethod(lambda n: n + 1)
+
+
+class Pred(Expr):
+    compute = staticmethod(lambda n: max(n - 1, 0))
+
+
+class Add(Expr):
+    compute = staticmethod(lambda m, n: m + n)
+
+
+class Sub(Expr):
+    compute = staticmethod(lambda m, n: max(m - n, 0))
+
+
+class Mul(Expr):
+    compute = staticmethod(lambda m, n: m * n)
+
+
+class Pow(Expr):
+    compute = staticmethod(lambda m, n: m ** n)
+
+
+def _floor_divide(m: int, n: int) -> int:
+    if n == 0:
+        raise ValueError("Деление на ноль")
+    return m // n
+
+
+class Div(Expr):
+    compute = staticmethod(_floor_divide)
+
+
+class Fact(Expr):
+    compute = staticmethod(math.factorial)
+
+
+# Имена операций ChurchCalculator.evaluate для узлов дерева
+OPERATIONS: Dict[type, str] = {
+    Add: 'add',
+    Sub: 'subtract',
+    Mul: 'multiply',
+    Div: 'divide',
+    Pow: 'power',
+    Fact: 'factorial',
+}
+
+
+def num(value: int) -> Num:
+    return Zero() if value == 0 else Num(value)
+
+
+def _is(node: Expr, value: int) -> bool:
+    return isinstance(node, Num) and node.value == value
+
+
+def _same(a: Expr, b: Expr) -> bool:
+    """Совпадение узлов без рекурсивного обхода поддеревьев."""
+    if a is b:
+        return True
+    if isinstance(a, Num) and isinstance(b, Num):
+        return a.value == b.value
+    return isinstance(a, Term) and isinstance(b, Term) and a.numeral is b.numeral
+
+
+def _offset(node: Expr) -> Tuple[Expr, int]:
+    """Раскладывает x + k (k — константа) на (x, k)."""
+    if isinstance(node, Add) and isinstance(node.operands[1], Num):
+        return node.operands[0], node.operands[1].value
+    return node, 0
+
+
+def rewrite(node: Expr) -> Expr:
+    """
+    Один шаг упрощения узла, операнды которого уже упрощены:
+    свёртка констант и алгебраические тождества.
+    """
+    operands = node.operands
+    if isinstance(node, (Num, Term)):
+        return node
+    if all(isinstance(a, Num) for a in operands):
+        return num(node.compute(*(a.value for a in operands)))
+
+    if isinstance(node, Succ):
+        # Цепочки succ сворачиваются в x + k.
+        base, k = _offset(operands[0])
+        return Add(base, Num(k + 1))
+    if isinstance(node, Pred):
+        base, k = _offset(operands[0])
+        if k > 0:
+            return rewrite(Add(base, num(k - 1)))
+        return node
+    if isinstance(node, Fact):
+        return node
+
+    a, b = operands
+    if isinstance(node, Add):
+        if _is(a, 0):
+            return b
+        if _is(b, 0):
+            return a
+        if isinstance(a, Num):
+            a, b = b, a
+        base, k = _offset(a)
+        if isinstance(b, Num) and k:
+            return Add(base, Num(k + b.value))
+        return Add(a, b)
+    if isinstance(node, Sub):
+        if _is(b, 0):
+            return a
+        if _same(a, b) or _is(a, 0):
+            return Zero()
+        if isinstance(a, Add) and _same(a.operands[1], b):
+            return a.operands[0]
+        base, k = _offset(a)
+        if isinstance(b, Num) and k >= b.value:
+            return rewrite(Add(base, num(k - b.value)))
+        return node
+    if isinstance(node, Mul):
+        if _is(a, 0) or _is(b, 0):
+            return Zero()
+        if _is(a, 1):
+            return b
+        if _is(b, 1):
+            return a
+        return node
+    if isinstance(node, Pow):
+        if _is(b, 0) or _is(a, 1):
+            return Num(1)
+        if _is(b, 1):
+            return a
+        return node
+    if isinstance(node, Div):
+        if _is(b, 1):
+            return a
+        return node
+    return node
+
+
+def walk(root: Expr, visit: Callable[[Expr, Tuple[Any, ...]], Any]) -> Any:
+    """
+    Обходит дерево в обратном порядке с явным стеком и возвращает
+    visit(root, ...), где visit получает результаты для операндов.
+    Общие поддеревья обрабатываются один раз.
+    """
+    results: Dict[int, Any] = {}
+    stack = [(root, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if id(node) in results:
+            continue
+        if isinstance(node, (Num, Term)):
+            results[id(node)] = visit(node, ())
+        elif expanded:
+            results[id(node)] = visit(node, tuple(results[id(a)] for a in node.operands))
+        else:
+            stack.append((node, True))
+            stack.extend((a, False) for a in node.operands)
+    return results[id(root)]
+
+
+def simplify(expr: Expr) -> Expr:
+    """Упрощает всё дерево снизу вверх."""
+    def visit(node: Expr, operands: Tuple[Expr, ...]) -> Expr:
+        if not operands:
+            return rewrite(node)
+        return rewrite(type(node)(*operands))
+    return walk(expr, visit)
+
+
+def evaluate(expr: Expr) -> int:
+    """Вычисляет значение выражения без рекурсии."""
+    def visit(node: Expr, values: Tuple[int, ...]) -> int:
+        if isinstance(node, Num):
+            return node.value
+        if isinstance(node, Term):
+            return node.numeral.to_int()
+        return node.compute(*values)
+    return walk(expr, visit)
+
+
+def church_evaluate(expr: Expr) -> int:
+    """
+    Вычисляет значение выражения движком Чёрча: каждый узел операции — через
+    ChurchCalculator.evaluate, поэтому работают кэш факториалов,
+    operation_hooks и счётчики instrument().
+    """
+    def visit(node: Expr, values: Tuple[int, ...]) -> int:
+        if isinstance(node, Num):
+            return node.value
+        if isinstance(node, Term):
+            return node.numeral.to_int()
+        operation = OPERATIONS.get(type(node))
+        if operation is None:
+            return node.compute(*values)
+        operands = [ChurchCalculator.from_int(value) for value in values]
+        return ChurchCalculator.evaluate(operation, *operands).to_int()
+    return walk(expr, visit)
+
+
+class SymbolicNumeral(ChurchNumeral):
+    """
+    Церковное число, заданное деревом выражения.
+
+    Значение вычисляется по упрощённому дереву; λ-терм fⁿ строится
+    только при применении числа к функции.
+    """
+
+    __slots__ = ('expr',)
+
+    def __init__(self, expr: Expr) -> None:
+        super().__init__(lambda f: ChurchCalculator.from_int(self.to_int())(f),
+                         value=expr.value if isinstance(expr, Num) else None)
+        self.expr = expr
+
+    def __repr__(self) -> str:
+        return f"SymbolicNumeral({self.expr!r})"
+
+    def to_int(self) -> int:
+        if self.value is None:
+            self.value = evaluate(self.expr)
+        return self.value
+
+
+class SymbolicCalculator(ChurchCalculator):
+    """
+    Калькулятор с тем же интерфейсом, что и ChurchCalculator,
+    но возвращающий символьные числа.
+    """
+
+    @staticmethod
+    def lift(n: ChurchNumeral) -> Expr:
+        """Переводит любое церковное число в узел дерева."""
+        if isinstance(n, SymbolicNumeral):
+            return n.expr
+        if n.value is not None:
+            return num(n.value)
+        return Term(n)
+
+    @staticmethod
+    def _build(node_type: type, *operands: ChurchNumeral) -> SymbolicNumeral:
+        expr = node_type(*(SymbolicCalculator.lift(n) for n in operands))
+        return SymbolicNumeral(rewrite(expr))
+
+    @staticmethod
+    def zero() -> SymbolicNumeral:
+        return SymbolicNumeral(Zero())
+
+    @staticmethod
+    def one() -> SymbolicNumeral:
+        return SymbolicNumeral(Num(1))
+
+    @staticmethod
+    def from_int(n: int) -> SymbolicNumeral:
+        if n < 0:
+            raise ValueError("Church numerals can only represent non-negative integers")
+        return SymbolicNumeral(num(n))
+
+    @staticmethod
+    def succ(n: ChurchNumeral) -> SymbolicNumeral:
+        return SymbolicCalculator._build(Succ, n)
+
+    @staticmethod
+    def pred(n: ChurchNumeral) -> SymbolicNumeral:
+        return SymbolicCalculator._build(Pred, n)
+
+    @staticmethod
+    def add(m: ChurchNumeral, n: ChurchNumeral) -> SymbolicNumeral:
+        return SymbolicCalculator._build(Add, m, n)
+
+    @staticmethod
+    def subtract(m: ChurchNumeral, n: ChurchNumeral) -> SymbolicNumeral:
+        return SymbolicCalculator._build(Sub, m, n)
+
+    @staticmethod
+    def multiply(m: ChurchNumeral, n: ChurchNumeral) -> SymbolicNumeral:
+        return SymbolicCalculator._build(Mul, m, n)
+
+    @staticmethod
+    def power(m: ChurchNumeral, n: ChurchNumeral) -> SymbolicNumeral:
+        return SymbolicCalculator._build(Pow, m, n)
+
+    @staticmethod
+    def divide(m: ChurchNumeral, n: ChurchNumeral) -> SymbolicNumeral:
+        """Целочисленное деление; деление на ноль — ValueError, как в divmod."""
+        return SymbolicCalculator._build(Div, m, n)
+
+    @staticmethod
+    def factorial(n: ChurchNumeral) -> SymbolicNumeral:
+        return SymbolicCalculator._build(Fact, n)
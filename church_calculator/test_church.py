@@ -9,11 +9,42 @@ import os
 # Добавляем путь для импорта
 sys.path.append(os.path.join(os.path.dirname(__file__), 'app'))
 
-from church import ChurchCalculator, ChurchNumeral, church_to_int, int_to_church
-from database import CalculationHistory
+from church import ChurchCalculator, ChurchNumeral, FactorialCache, church_to_int, int_to_church, instrument
+from symbolic import SymbolicCalculator, Add, Num, Term
+from binary import BinaryCalculator
+from executor import CalculationCancelled, ChurchExecutor
+from cost import ACCEPT, QUEUE, REJECT, CostBudget, TooExpensiveError, estimate
+from database import AsyncHistory, CalculationHistory, ChangeWatcher, HistoryWriter
+from retention import RetentionPolicy, read_archive
+from expression_parser import ExpressionParser, tokenize
+from calculation import CalculationPipeline, ExpressionCache
+import benchmarks
+import metrics
+from metrics import Histogram, Registry
 import tempfile
+import threading
 import time
 
+# Веб-версия при импорте открывает базу по умолчанию: в тестах — временную
+os.environ['CHURCH_DB_PATH'] = os.path.join(tempfile.mkdtemp(), 'calculator.db')
+
+
+@pytest.fixture
+def web(tmp_path, monkeypatch):
+    """Веб-версия с историей, очередью записи и кэшем во временной базе."""
+    from church_calculator import church_web
+    history = CalculationHistory(str(tmp_path / "web.db"))
+    writer = HistoryWriter(history)
+    monkeypatch.setattr(church_web, 'db', history)
+    monkeypatch.setattr(church_web, 'history_writer', writer)
+    monkeypatch.setattr(church_web, 'DATABASE_AVAILABLE', True)
+    monkeypatch.setattr(church_web, 'pipeline', CalculationPipeline(
+        church_web.cost_budget, church_web.church_executor,
+        cache=ExpressionCache(), store=history))
+    yield church_web
+    writer.close()
+    history.close()
+
 class TestChurchNumerals:
     """Тесты для церковных чисел."""
     
@@ -126,6 +157,277 @@ class TestChurchNumeralMethods:
         result = result_function(0)
         assert result == 2
 
+class TestInstrumentation:
+    """Тесты подсчёта работы λ-движка."""
+    
+    def test_counts_applications(self):
+        """Применения f, замыкания и глубина дерева операций считаются в instrument()."""
+        two = ChurchNumeral(lambda f: lambda x: f(f(x)))
+        three = ChurchNumeral(lambda f: lambda x: f(f(f(x))))
+        with instrument() as stats:
+            product = ChurchCalculator.multiply(two, ChurchCalculator.add(three, two))
+            assert product.to_int() == 10
+        assert stats.applications == 5
+        assert stats.closures == 2
+        assert stats.max_depth == 3
+        assert stats.sections['to_int']['calls'] == 1
+    
+    def test_disabled_by_default(self):
+        """Вне instrument() счётчики не меняются."""
+        with instrument() as stats:
+            pass
+        ChurchNumeral(lambda f: lambda x: f(x)).to_int()
+        assert stats.as_dict()['applications'] == 0
+    
+    def test_sections_by_operation(self):
+        """Операции по известным значениям выполняются без применений f."""
+        with instrument() as outer:
+            with instrument() as inner:
+                ChurchCalculator.evaluate('power', int_to_church(3), int_to_church(4))
+            church_to_int(ChurchCalculator.pred(ChurchNumeral(lambda f: lambda x: f(f(x)))))
+        assert inner.sections['power'] == {'calls': 1, 'applications': 0,
+                                           'closures': 0, 'shortcuts': 1}
+        assert outer.applications == 2 and outer.shortcuts >= 1
+    
+    def test_calculate_fields(self, web):
+        """/calculate возвращает счётчики только по запросу."""
+        client = web.app.test_client()
+        data = client.post('/calculate', json={'expression': '3*4', 'instrument': True}).get_json()
+        assert data['result'] == 12
+        assert set(data['instrumentation']) >= {'applications', 'closures', 'max_depth'}
+        assert 'instrumentation' not in client.post('/calculate', json={'expression': '3*4'}).get_json()
+
+class TestCachedValue:
+    """Тесты быстрого пути с кэшированным целым значением."""
+    
+    def test_large_from_int(self):
+        """Большие числа создаются и преобразуются без глубоких замыканий."""
+        church_num = int_to_church(100000)
+        assert church_to_int(church_num) == 100000
+    
+    def test_value_propagation(self):
+        """Операции над числами с известным значением сразу знают результат."""
+        a = int_to_church(300)
+        b = int_to_church(7)
+        assert ChurchCalculator.add(a, b).value == 307
+        assert ChurchCalculator.multiply(a, b).value == 2100
+        assert ChurchCalculator.power(b, int_to_church(3)).value == 343
+    
+    def test_lazy_lambda(self):
+        """λ-терм строится только при применении к функции."""
+        church_num = ChurchCalculator.add(int_to_church(2), int_to_church(3))
+        assert church_num(lambda s: s + "a")("") == "aaaaa"
+    
+    def test_foreign_numeral(self):
+        """Числа, заданные только λ-термом, вычисляются по-старому."""
+        three = ChurchNumeral(lambda f: lambda x: f(f(f(x))))
+        assert three.value is None
+        result = ChurchCalculator.add(three, int_to_church(2))
+        assert church_to_int(result) == 5
+        assert result.value == 5
+
+class TestKleenePredecessor:
+    """Тесты предшественника и вычитания на парах Чёрча."""
+    
+    @staticmethod
+    def lambda_only(n):
+        return ChurchNumeral(int_to_church(n).numeral)
+    
+    def test_pred(self):
+        """pred строится без вычисления аргумента."""
+        for i in range(0, 6):
+            result = ChurchCalculator.pred(self.lambda_only(i))
+            assert result.value is None
+            assert church_to_int(result) == max(i - 1, 0)
+    
+    def test_subtract_large(self):
+        """Вычитание больших чисел выполняется за линейное время."""
+        result = ChurchCalculator.subtract(self.lambda_only(1000), self.lambda_only(500))
+        assert church_to_int(result) == 500
+        result = ChurchCalculator.subtract(self.lambda_only(3), self.lambda_only(10))
+        assert church_to_int(result) == 0
+
+    def test_lambda_term(self):
+        """Чистые λ-термы pred и subtract считают по парам, а не по значениям."""
+        for i in range(0, 6):
+            result = ChurchCalculator.pred(self.lambda_only(i))
+            assert result.numeral(lambda x: x + 1)(0) == max(i - 1, 0)
+        result = ChurchCalculator.subtract(self.lambda_only(7), self.lambda_only(3))
+        assert result.numeral(lambda x: x + 1)(0) == 4
+        result = ChurchCalculator.subtract(self.lambda_only(3), self.lambda_only(7))
+        assert result.numeral(lambda x: x + 1)(0) == 0
+        assert result.value is None
+
+class TestStackSafeEvaluation:
+    """Тесты вычисления дерева операций без рекурсии."""
+    
+    def test_deep_succ_chain(self):
+        """Цепочка succ глубже предела рекурсии вычисляется без ошибок."""
+        depth = sys.getrecursionlimit() * 20
+        result = ChurchNumeral(lambda f: lambda x: f(x))
+        for _ in range(depth):
+            result = ChurchCalculator.succ(result)
+        assert church_to_int(result) == depth + 1
+        assert result(lambda x: x + 2)(0) == 2 * (depth + 1)
+    
+    def test_mixed_tree(self):
+        """Дерево из разных операций вычисляется по замкнутым формулам."""
+        two = ChurchNumeral(lambda f: lambda x: f(f(x)))
+        three = ChurchCalculator.succ(two)
+        result = ChurchCalculator.power(ChurchCalculator.add(two, three), two)
+        result = ChurchCalculator.subtract(ChurchCalculator.multiply(result, three), two)
+        assert result.op == 'subtract'
+        assert church_to_int(result) == 73
+    
+    def test_lambda_term_kept(self):
+        """λ-терм составного числа по-прежнему доступен."""
+        two = ChurchNumeral(lambda f: lambda x: f(f(x)))
+        result = ChurchCalculator.multiply(two, ChurchCalculator.pred(two))
+        assert result.numeral(lambda x: x + 1)(0) == 2
+
+class TestDivision:
+    """Тесты деления и остатка."""
+    
+    def test_divmod(self):
+        """Деление повторным вычитанием через комбинатор неподвижной точки."""
+        for a, b in [(0, 3), (7, 3), (3, 7), (12, 4), (100, 1)]:
+            q, r = ChurchCalculator.divmod(int_to_church(a), int_to_church(b))
+            assert (church_to_int(q), church_to_int(r)) == divmod(a, b)
+    
+    def test_divmod_lambda_only(self):
+        """Деление чисел, заданных только λ-термами."""
+        seven = ChurchNumeral(int_to_church(7).numeral)
+        two = ChurchNumeral(lambda f: lambda x: f(f(x)))
+        q, r = ChurchCalculator.divmod(seven, two)
+        assert (church_to_int(q), church_to_int(r)) == (3, 1)
+    
+    def test_divmod_fast(self):
+        """Быстрый вариант использует кэшированные значения."""
+        q, r = ChurchCalculator.divmod_fast(int_to_church(10 ** 6), int_to_church(7))
+        assert (church_to_int(q), church_to_int(r)) == divmod(10 ** 6, 7)
+    
+    def test_divide_by_zero(self):
+        with pytest.raises(ValueError):
+            ChurchCalculator.divmod(int_to_church(5), ChurchCalculator.zero())
+        with pytest.raises(ValueError):
+            ChurchCalculator.divmod_fast(int_to_church(5), ChurchCalculator.zero())
+
+class TestFactorialCache:
+    """Тесты кэша факториалов."""
+    
+    def test_repeated_requests(self):
+        """Повторные запросы обслуживаются из кэша."""
+        cache = FactorialCache()
+        assert church_to_int(cache.get(5)) == 120
+        assert church_to_int(cache.get(5)) == 120
+        assert cache.hits == 1
+        assert cache.misses == 1
+    
+    def test_prefix_reuse(self):
+        """Новый факториал продолжает наибольший закэшированный префикс."""
+        cache = FactorialCache()
+        cache.get(10)
+        assert church_to_int(cache.get(12)) == 479001600
+        assert church_to_int(cache.get(11)) == 39916800
+    
+    def test_bounded_size(self):
+        """Кэш не растёт больше заданного размера."""
+        cache = FactorialCache(maxsize=3)
+        for n in range(1, 10):
+            cache.get(n)
+        assert len(cache) == 3
+        assert church_to_int(cache.get(1)) == 1
+    
+    def test_large_factorial(self):
+        """Большие факториалы вычисляются без рекурсии."""
+        result = ChurchCalculator.factorial(int_to_church(sys.getrecursionlimit() * 2))
+        assert church_to_int(result) > 0
+
+class TestSymbolicCalculator:
+    """Тесты символьного представления выражений."""
+    
+    def test_constant_folding(self):
+        """Выражения над константами сворачиваются без вычисления λ-термов."""
+        result = SymbolicCalculator.power(SymbolicCalculator.from_int(2), SymbolicCalculator.from_int(20))
+        assert isinstance(result.expr, Num)
+        assert church_to_int(result) == 2 ** 20
+        result = SymbolicCalculator.factorial(SymbolicCalculator.from_int(12))
+        assert church_to_int(result) == 479001600
+    
+    def test_algebraic_simplification(self):
+        """Тождества упрощают дерево с λ-термами."""
+        two = ChurchNumeral(lambda f: lambda x: f(f(x)))
+        result = two
+        for _ in range(5):
+            result = SymbolicCalculator.succ(result)
+        assert isinstance(result.expr, Add)
+        assert result.expr.operands[1].value == 5
+        
+        same = SymbolicCalculator.subtract(SymbolicCalculator.add(result, two), two)
+        assert same.expr is result.expr
+        product = SymbolicCalculator.multiply(two, SymbolicCalculator.one())
+        assert isinstance(product.expr, Term)
+        assert church_to_int(result) == 7
+    
+    def test_lambda_semantics(self):
+        """Символьное число применяется к функции как обычное церковное."""
+        three = ChurchNumeral(lambda f: lambda x: f(f(f(x))))
+        result = SymbolicCalculator.factorial(three)
+        assert result(lambda s: s + "a")("") == "aaaaaa"
+        assert church_to_int(ChurchCalculator.add(result, three)) == 9
+
+    def test_operand_of_church_tree(self):
+        """Символьное число в дереве ChurchCalculator считается своим to_int, а не fⁿ."""
+        two = ChurchNumeral(lambda f: lambda x: f(f(x)))
+        large = SymbolicCalculator.power(two, SymbolicCalculator.from_int(22))
+        with instrument() as stats:
+            result = ChurchCalculator.add(large, ChurchCalculator.one())
+            assert church_to_int(result) == 2 ** 22 + 1
+        # Применяется только λ-терм двойки
+        assert stats.applications == 2
+
+    def test_divide(self):
+        seven = ChurchNumeral(lambda f: lambda x: f(f(f(f(f(f(f(x))))))))
+        assert church_to_int(SymbolicCalculator.divide(seven, SymbolicCalculator.from_int(2))) == 3
+        with pytest.raises(ValueError):
+            SymbolicCalculator.divide(SymbolicCalculator.from_int(7), SymbolicCalculator.zero())
+
+class TestBinaryNumerals:
+    """Тесты двоичного λ-кодирования."""
+    
+    def test_round_trip(self):
+        """Преобразование в двоичный вид и обратно сохраняет число."""
+        for i in (0, 1, 2, 5, 1024, 10 ** 20):
+            binary = BinaryCalculator.from_int(i)
+            assert binary.to_int() == i
+            assert len(binary) == i.bit_length()
+        church = BinaryCalculator.to_church(BinaryCalculator.from_church(int_to_church(42)))
+        assert church_to_int(church) == 42
+    
+    def test_arithmetic(self):
+        """Операции над битами совпадают с целочисленными."""
+        cases = [(0, 0), (7, 3), (3, 7), (255, 1), (1000, 37), (12345, 12345)]
+        for a, b in cases:
+            m, n = BinaryCalculator.from_int(a), BinaryCalculator.from_int(b)
+            assert BinaryCalculator.add(m, n).to_int() == a + b
+            assert BinaryCalculator.subtract(m, n).to_int() == max(a - b, 0)
+            assert BinaryCalculator.multiply(m, n).to_int() == a * b
+            assert BinaryCalculator.compare(m, n) == (a > b) - (a < b)
+            if b:
+                q, r = BinaryCalculator.divmod(m, n)
+                assert (q.to_int(), r.to_int()) == divmod(a, b)
+        two, ten = BinaryCalculator.from_int(2), BinaryCalculator.from_int(10)
+        assert BinaryCalculator.power(two, ten).to_int() == 1024
+    
+    def test_divide_by_zero(self):
+        with pytest.raises(ValueError):
+            BinaryCalculator.divmod(BinaryCalculator.from_int(5), BinaryCalculator.zero())
+    
+    def test_calculate(self):
+        """Двоичный движок вычисляет операции парсера над целыми операндами."""
+        assert BinaryCalculator.calculate('multiply', 10 ** 12, 10 ** 12) == 10 ** 24
+        assert BinaryCalculator.calculate('divide', 10 ** 12, 7) == 10 ** 12 // 7
+
 class TestExpressionParser:
     """Тесты для парсера выражений."""
     
@@ -149,6 +451,421 @@ class TestExpressionParser:
             ExpressionParser.parse_expression("invalid")
 
 
+class TestPrattParser:
+    """Тесты разбора вложенных выражений."""
+    
+    def test_precedence(self):
+        """! выше ^, ^ правоассоциативна, * выше +."""
+        assert ExpressionParser.evaluate("(2+3)*4!^2") == 2880
+        assert ExpressionParser.evaluate("2^3^2") == 512
+        assert ExpressionParser.evaluate("10-2-3") == 5
+        assert ExpressionParser.evaluate("2+3*4") == 14
+        assert ExpressionParser.evaluate("3!!") == 720
+    
+    def test_tokenize(self):
+        assert tokenize("(12+3.5)*4!") == ['(', '12', '+', '3.5', ')', '*', '4', '!']
+        with pytest.raises(ValueError):
+            tokenize("2+x")
+    
+    def test_simple_and_nested(self):
+        """Одна операция над числами сводится к кортежу, вложенная — нет."""
+        assert ExpressionParser.parse_expression(" 2,5 * 2 ") == ('multiply', 2.5, 2.0)
+        tree = ExpressionParser.parse("(2+3)*4")
+        assert ExpressionParser.as_tuple(tree) is None
+        assert ExpressionParser.operation(tree) == 'multiply'
+        with pytest.raises(ValueError):
+            ExpressionParser.parse_expression("(2+3)*4")
+    
+    def test_invalid(self):
+        for expression in ("", "5+", "(2+3", "2+3)", "()", "5(3)"):
+            with pytest.raises(ValueError):
+                ExpressionParser.parse(expression)
+        with pytest.raises(ValueError, match="Факториал"):
+            ExpressionParser.parse("(2.5)!+1")
+    
+    def test_church_engine(self):
+        """Узлы вложенного выражения вычисляются операциями ChurchCalculator."""
+        with instrument() as stats:
+            assert ExpressionParser.evaluate("(2+3)*4!") == 120
+            assert ChurchExecutor().run_tree(ExpressionParser.parse("10/(7-4)")) == 3
+        assert set(stats.sections) >= {'add', 'multiply', 'factorial', 'subtract', 'divide'}
+    
+    def test_large_literals(self):
+        """Целые числа читаются точно, без перевода в float."""
+        assert ExpressionParser.evaluate("9007199254740993+0") == 9007199254740993
+        digits = '1' * 400
+        assert ExpressionParser.parse_expression(f"{digits}+1") == ('add', int(digits), 1)
+        with pytest.raises(TooExpensiveError):
+            CalculationPipeline(cache=ExpressionCache()).calculate(f"{digits}!")
+        with pytest.raises(ValueError, match="Слишком длинное число"):
+            ExpressionParser.parse('1' * 100000 + '+1')
+    
+    def test_deep_nesting(self):
+        """Слишком глубокое выражение — ошибка разбора, а не переполнение стека."""
+        assert ExpressionParser.evaluate('(' * 150 + '2+3' + ')' * 150) == 5
+        pipeline = CalculationPipeline(cache=ExpressionCache())
+        parse_errors = metrics.ERRORS.value('parse')
+        for expression in ('(' * 1000 + '1' + ')' * 1000, '^'.join(['2'] * 3000)):
+            with pytest.raises(ValueError):
+                pipeline.calculate(expression)
+        assert metrics.ERRORS.value('parse') == parse_errors + 2
+    
+    def test_calculate_nested(self, web):
+        client = web.app.test_client()
+        response = client.post('/calculate', json={'expression': '(2+3)*4!^2'})
+        assert response.get_json()['result'] == 2880
+        response = client.post('/calculate', json={'expression': '(9^9)^(9^9)'})
+        assert response.status_code == 422
+
+class TestExpressionCache:
+    """Тесты кэша результатов по нормализованному выражению."""
+    
+    def test_hits_by_normalized_text(self):
+        pipeline = CalculationPipeline(cache=ExpressionCache())
+        first = pipeline.calculate("2 + 3")
+        assert pipeline.calculate("2+3") is first
+        assert first.result == 5
+        assert pipeline.cache.stats()['hits'] == 1
+        assert pipeline.cache.stats()['misses'] == 1
+    
+    def test_eviction(self):
+        pipeline = CalculationPipeline(cache=ExpressionCache(maxsize=2))
+        for expression in ("1+1", "2+2", "1+1", "3+3"):
+            pipeline.calculate(expression)
+        stats = pipeline.cache.stats()
+        assert stats['size'] == 2 and stats['evictions'] == 1
+        pipeline.calculate("1+1")
+        assert pipeline.cache.stats()['hits'] == 2
+    
+    def test_errors_not_cached(self):
+        pipeline = CalculationPipeline(cache=ExpressionCache())
+        with pytest.raises(ValueError):
+            pipeline.calculate("5/0")
+        assert len(pipeline.cache) == 0
+        assert pipeline.calculate("3-5").warning
+    
+    def test_persistent_store(self, tmp_path, monkeypatch):
+        """Вычисленные ранее выражения берутся из истории после перезапуска."""
+        history = CalculationHistory(str(tmp_path / "cache.db"))
+        first = CalculationPipeline(cache=ExpressionCache(), store=history)
+        calculation = first.calculate("30 !")
+        history.save_calculation(calculation.expression, calculation.result, calculation.operation)
+        history.save_calculation("3-5", 0, 'subtract')
+        
+        restarted = CalculationPipeline(cache=ExpressionCache(), store=history)
+        monkeypatch.setattr(restarted, '_evaluate', lambda *args: pytest.fail("пересчёт"))
+        assert restarted.calculate("30!").result == calculation.result
+        assert restarted.calculate("3-5").warning
+        assert restarted.stats()['store_hits'] == 2
+    
+    def test_warm(self, tmp_path):
+        history = CalculationHistory(str(tmp_path / "warm.db"))
+        history.save_calculations([("2+2", 4, 'add'), ("2+2", 4, 'add'), ("3*3", 9, 'multiply')])
+        assert history.most_frequent(1) == [("2+2", 'add', '4')]
+        pipeline = CalculationPipeline(cache=ExpressionCache(), store=history)
+        assert pipeline.warm() == 2
+        assert pipeline.calculate("3*3").result == 9
+        assert pipeline.cache.stats()['hits'] == 1
+    
+    def test_health_reports_cache(self, web):
+        client = web.app.test_client()
+        client.post('/calculate', json={'expression': '7*6'})
+        stats = client.get('/health').get_json()['cache']
+        assert {'hits', 'misses', 'evictions', 'size'} <= set(stats)
+
+class TestBatchEvaluation:
+    """Тесты пакетного вычисления выражений."""
+    
+    def test_evaluate_many(self):
+        """Результаты возвращаются в порядке входных выражений."""
+        expressions = [('add', 2, 3), ('factorial', 5, None), ('add', 2, 3), ('divide', 7, 2)]
+        results = ChurchCalculator.evaluate_many(expressions)
+        assert [church_to_int(r) for r in results] == [5, 120, 5, 3]
+        assert results[0] is results[2]
+    
+    def test_evaluate_many_errors(self):
+        """Ошибка одного выражения не мешает остальным."""
+        results = ChurchCalculator.evaluate_many([('divide', 1, 0), ('power', 2, 10)],
+                                                 return_exceptions=True)
+        assert isinstance(results[0], ValueError)
+        assert church_to_int(results[1]) == 1024
+        with pytest.raises(ValueError):
+            ChurchCalculator.evaluate_many([('divide', 1, 0)])
+    
+    def test_shared_subexpressions(self):
+        """Общие подвыражения пакета вычисляются один раз."""
+        from concurrent.futures import ThreadPoolExecutor
+        pipeline = CalculationPipeline(cache=ExpressionCache())
+        additions = metrics.OPERATION_SECONDS.count('add')
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            results = pipeline.calculate_many(['(2+3)*4', '(2+3)*5', '2+3', '(2+3)*4', '2 +', '3-5'],
+                                              pool, timeout=5)
+        assert [r.result for r in results[:4]] == [20, 25, 5, 20]
+        assert isinstance(results[4], ValueError)
+        assert results[5].result == 0 and results[5].warning
+        assert metrics.OPERATION_SECONDS.count('add') == additions + 1
+        assert pipeline.calculate('(2+3)*5').result == 25 and pipeline.stats()['hits'] == 1
+    
+    def test_batch_deadline(self):
+        """Тяжёлое выражение, не уложившееся в срок пакета, отклоняется, остальные считаются."""
+        from concurrent.futures import ThreadPoolExecutor
+        executor = ChurchExecutor(timeout=30)
+        pipeline = CalculationPipeline(CostBudget(max_result_bits=2 ** 40), executor,
+                                       cache=ExpressionCache())
+        try:
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                start = time.monotonic()
+                slow, fast = pipeline.calculate_many(['9^10000000000', '6*7'], pool, timeout=0.3)
+                assert time.monotonic() - start < 5
+            assert isinstance(slow, TooExpensiveError)
+            assert fast.result == 42
+        finally:
+            executor.shutdown()
+    
+    def test_batch_endpoint(self, web):
+        """Пакетный запрос вычисляет выражения и пишет историю одной транзакцией."""
+        history, writer, pipeline = web.db, web.history_writer, web.pipeline
+        client = web.app.test_client()
+        response = client.post('/calculate/batch', json={'expressions': ['2+3', '5!', 'bad', '2+3']})
+        data = response.get_json()
+        assert response.status_code == 200
+        assert [item['success'] for item in data['results']] == [True, True, False, True]
+        assert data['results'][1]['result'] == 120
+        assert pipeline.stats()['hits'] == 0
+        writer.close()
+        assert len(history.get_calculation_history(limit=10)) == 3
+        assert writer.stats()['batches'] == 1
+        
+        # Те же правила, что и у /calculate: отказ по стоимости, вложенные выражения
+        response = client.post('/calculate/batch', json={'expressions': ['99^999999999', '(2+3)*4', '3-5']})
+        rejected, nested, subtract = response.get_json()['results']
+        assert rejected['too_expensive'] is True
+        assert nested['result'] == 20
+        assert subtract['warning']
+        
+        response = client.post('/calculate/batch', json={'expression': '2+3'})
+        assert response.status_code == 400
+    
+    def test_restart_services(self, tmp_path, monkeypatch):
+        """Фоновые потоки истории останавливаются перед fork и запускаются заново."""
+        from church_calculator import church_web
+        history = CalculationHistory(str(tmp_path / "services.db"))
+        monkeypatch.setattr(church_web, 'db', history)
+        monkeypatch.setattr(church_web, 'history_writer', None)
+        monkeypatch.setattr(church_web, 'retention', None)
+        monkeypatch.setattr(church_web, 'DATABASE_AVAILABLE', True)
+        
+        church_web.start_services()
+        assert church_web.history_writer is not None
+        response = church_web.app.test_client().post('/calculate', json={'expression': '6*7'})
+        assert response.get_json()['result'] == 42
+        church_web.stop_services()
+        assert church_web.history_writer is None and church_web.retention is None
+        assert history.get_statistics()['total_calculations'] == 1
+
+class TestCostModel:
+    """Тесты оценки стоимости и допуска выражений."""
+    
+    def test_estimate(self):
+        """Оценка длины результата близка к точной."""
+        assert estimate('power', 2.0, 100.0).result_bits == 101
+        assert estimate('factorial', 20.0, None).result_bits == (2432902008176640000).bit_length()
+        assert estimate('multiply', 255.0, 255.0).result_bits == 16
+        assert estimate('add', 5.0, 3.0).result_bits == 4
+    
+    def test_work_grows_with_operands(self):
+        """Оценка работы λ-вычисления растёт вместе с результатом."""
+        small = estimate('power', 2.0, 10.0)
+        large = estimate('power', 2.0, 1000.0)
+        assert large.log2_applications > small.log2_applications
+        assert 2 ** 10 <= small.applications < 2 ** 12
+        assert large.memory_bytes > small.memory_bytes
+    
+    def test_admission(self):
+        """Решения бюджета: сразу, в очередь или отказ."""
+        budget = CostBudget(inline_result_bits=100, max_result_bits=1000)
+        assert budget.admit(estimate('power', 2.0, 10.0)) == ACCEPT
+        assert budget.admit(estimate('power', 2.0, 500.0)) == QUEUE
+        assert budget.admit(estimate('power', 99.0, 999.0)) == REJECT
+        with pytest.raises(TooExpensiveError):
+            budget.check('power', 99.0, 999.0)
+        assert budget.check('factorial', 5.0, None) == ACCEPT
+    
+    def test_result_text_bounded(self):
+        """Допустимый результат переводится в десятичный текст быстро."""
+        budget = CostBudget()
+        assert budget.check('power', 3, 165000) == QUEUE
+        with pytest.raises(TooExpensiveError):
+            budget.check('power', 3, 660002)
+        start = time.perf_counter()
+        str(3 ** 165000)
+        assert time.perf_counter() - start < 1.0
+    
+    def test_long_operands(self):
+        """Длинные операнды оцениваются только по длине результата."""
+        budget = CostBudget()
+        assert budget.check('add', 2 ** 300, 2 ** 300) == ACCEPT
+        assert budget.check('multiply', 10 ** 300, 10 ** 300) == ACCEPT
+        assert budget.check('divide', 10 ** 3000, 7) == ACCEPT
+    
+    def test_rejected_request(self, web):
+        """Веб-API отклоняет слишком дорогие выражения до вычисления."""
+        client = web.app.test_client()
+        response = client.post('/calculate', json={'expression': '99^999999999'})
+        assert response.status_code == 422
+        assert response.get_json()['too_expensive'] is True
+
+class TestChurchExecutor:
+    """Тесты выполнения тяжёлых операций в отдельных процессах."""
+    
+    def test_cheap_inline(self):
+        """Дешёвые операции считаются без отдельного процесса."""
+        executor = ChurchExecutor()
+        assert not executor.is_heavy('factorial', 10)
+        assert executor.run('factorial', 10) == 3628800
+        assert executor.started == 0
+    
+    def test_heavy_in_process(self):
+        """Тяжёлые операции считаются в отдельном процессе, ошибки доходят до вызова."""
+        executor = ChurchExecutor(inline_bits=0)
+        try:
+            assert executor.run('power', 3, 5) == 243
+            assert executor.started == 1
+            with pytest.raises(ValueError):
+                executor.run('divide', 1, 0)
+        finally:
+            executor.shutdown()
+    
+    def test_cancel_is_isolated(self):
+        """Отмена одного вычисления не прерывает вычисления других клиентов."""
+        import math
+        executor = ChurchExecutor(timeout=30, inline_bits=0)
+        results = []
+        other = threading.Thread(target=lambda: results.append(executor.run('factorial', 80000)))
+        other.start()
+        try:
+            for _ in range(2):
+                cancel = threading.Event()
+                threading.Timer(0.2, cancel.set).start()
+                with pytest.raises(CalculationCancelled):
+                    executor.run('power', 9, 10 ** 10, cancel=cancel)
+            other.join()
+            assert results == [math.factorial(80000)]
+        finally:
+            executor.shutdown()
+    
+    def test_long_operands_inline(self):
+        """Длинные операнды с коротким результатом считаются в текущем потоке."""
+        executor = ChurchExecutor()
+        a, b = 10 ** 300 + 1, 10 ** 300 + 3
+        start = time.perf_counter()
+        assert not executor.is_heavy('multiply', a, b)
+        assert executor.run('multiply', a, b) == a * b
+        assert executor.run('divide', a * b, b) == a
+        assert time.perf_counter() - start < 0.5
+        assert executor.started == 0
+    
+    def test_timeout(self):
+        """Слишком долгое вычисление прерывается с понятной ошибкой."""
+        executor = ChurchExecutor(timeout=0.2)
+        try:
+            with pytest.raises(TooExpensiveError):
+                executor.run('power', 9, 10 ** 10)
+            assert executor.run('power', 2, 10) == 1024
+        finally:
+            executor.shutdown()
+    
+    def test_cancel(self):
+        """Отмена останавливает процесс, не дожидаясь тайм-аута."""
+        executor = ChurchExecutor(timeout=30)
+        cancel = threading.Event()
+        threading.Timer(0.2, cancel.set).start()
+        try:
+            start = time.monotonic()
+            with pytest.raises(CalculationCancelled):
+                executor.run('power', 9, 10 ** 10, cancel=cancel)
+            assert time.monotonic() - start < 5
+            assert executor.run('power', 2, 10) == 1024
+        finally:
+            executor.shutdown()
+    
+    def test_cancelled_not_cached(self):
+        """Отменённое выражение не попадает в кэш, оценка считается без вычисления."""
+        pipeline = CalculationPipeline(cache=ExpressionCache())
+        cancel = threading.Event()
+        cancel.set()
+        with pytest.raises(CalculationCancelled):
+            pipeline.calculate('2^10', cancel=cancel)
+        assert len(pipeline.cache) == 0
+        assert pipeline.estimate('2^10').result_bits == 11
+        assert pipeline.calculate('2^10').result == 1024
+
+class TestBenchmarkRegressions:
+    """Тесты сравнения замеров с базовой линией."""
+    
+    @staticmethod
+    def result(seconds):
+        sizes = [10, 100, 1000]
+        return {'sizes': sizes, 'seconds': seconds, 'peak_bytes': [0, 0, 0],
+                'slope': benchmarks.slope(sizes, seconds)}
+    
+    def test_slope(self):
+        """Наклон в log-log равен показателю степени роста."""
+        assert benchmarks.slope([10, 100, 1000], [1e-3, 1e-2, 1e-1]) == pytest.approx(1.0)
+        assert benchmarks.slope([10, 100, 1000], [1e-4, 1e-2, 1.0]) == pytest.approx(2.0)
+    
+    def test_compare(self):
+        """Замедление больше 20% и рост асимптотики считаются регрессией, шум — нет."""
+        baseline = {'multiply': self.result([1e-3, 1e-2, 1e-1])}
+        assert benchmarks.compare(baseline, {'multiply': self.result([1.1e-3, 1.1e-2, 1.1e-1])}) == []
+        slower = benchmarks.compare(baseline, {'multiply': self.result([1.3e-3, 1.3e-2, 1.3e-1])})
+        assert [operation for operation, _ in slower] == ['multiply']
+        # Быстрее на малых размерах, но квадратичный рост
+        steeper = benchmarks.compare(baseline, {'multiply': self.result([1e-5, 1e-3, 1e-1])})
+        assert any('O(n^' in description for _, description in steeper)
+        assert benchmarks.compare(baseline, {'power': self.result([1.0, 1.0, 1.0])}) == []
+
+class TestMetrics:
+    """Тесты метрик в формате Prometheus."""
+    
+    def test_histogram_render(self):
+        """Корзины гистограммы накапливаются, +Inf равна числу наблюдений."""
+        registry = Registry()
+        histogram = Histogram('test_seconds', 'Тест', ('operation',),
+                              buckets=(0.1, 1.0), registry=registry)
+        for value in (0.05, 0.5, 5.0):
+            histogram.observe(value, 'add')
+        text = registry.render()
+        assert '# TYPE test_seconds histogram' in text
+        assert 'test_seconds_bucket{operation="add",le="0.1"} 1' in text
+        assert 'test_seconds_bucket{operation="add",le="1.0"} 2' in text
+        assert 'test_seconds_bucket{operation="add",le="+Inf"} 3' in text
+        assert 'test_seconds_count{operation="add"} 3' in text
+    
+    def test_metrics_endpoint(self, web):
+        """Вычисления, отказы и ошибки попадают в /metrics."""
+        client = web.app.test_client()
+        rejected = metrics.REJECTED.value()
+        parse_errors = metrics.ERRORS.value('parse')
+        multiply = metrics.EVALUATE_SECONDS.count('multiply')
+        operations = metrics.OPERATION_SECONDS.count('multiply')
+        
+        # Пустые кэш и история; умножение выполняет ChurchCalculator в этом же процессе
+        client.post('/calculate', json={'expression': '1234*6789'})
+        client.post('/calculate', json={'expression': '10^10^10'})
+        client.post('/calculate', json={'expression': '2 +'})
+        assert metrics.EVALUATE_SECONDS.count('multiply') == multiply + 1
+        assert metrics.REJECTED.value() == rejected + 1
+        assert metrics.ERRORS.value('parse') == parse_errors + 1
+        assert metrics.OPERATION_SECONDS.count('multiply') == operations + 1
+        
+        response = client.get('/metrics')
+        assert response.content_type.startswith('text/plain')
+        text = response.get_data(as_text=True)
+        for name in ('church_parse_seconds_bucket', 'church_evaluate_seconds_count{operation="multiply"}',
+                     'church_db_seconds', 'church_rejected_total', 'church_cache_hit_ratio'):
+            assert name in text
+
 class TestDatabase:
     """Тесты для базы данных."""
     
@@ -178,9 +895,8 @@ class TestDatabase:
             # Удаляем временный файл с задержкой для Windows
             if os.path.exists(db_path):
                 try:
-                    # Закрываем соединение с базой
-                    if hasattr(db, '_conn'):
-                        db._conn.close()
+                    # Закрываем соединения пула с базой
+                    db.close()
                     # Даем время системе освободить файл
                     time.sleep(0.1)
                     os.unlink(db_path)
@@ -188,6 +904,291 @@ class TestDatabase:
                     # Если файл все еще занят, пропускаем удаление
                     print(f"⚠️ Не удалось удалить файл {db_path}, он будет удален при следующем запуске")
     
+    def test_concurrent_writers(self, tmp_path):
+        """Параллельные писатели из разных потоков не теряют записей."""
+        import threading
+        db = CalculationHistory(str(tmp_path / "concurrent.db"))
+        threads = [threading.Thread(target=lambda k=k: [db.save_calculation(f"{k}+{i}", k + i, 'add')
+                                                        for i in range(20)])
+                   for k in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert db.get_statistics()['total_calculations'] == 320
+        mode = db.pool.connection().execute('PRAGMA journal_mode').fetchone()[0]
+        assert mode == 'wal'
+        db.close()
+    
+    def test_statistics_table(self, tmp_path):
+        """Счётчики ведутся триггерами и переносятся со старой таблицы."""
+        import sqlite3
+        path = str(tmp_path / "stats.db")
+        conn = sqlite3.connect(path)
+        conn.executescript('''
+            CREATE TABLE calculations (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                expression TEXT NOT NULL, result TEXT NOT NULL,
+                operation_type TEXT NOT NULL, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP);
+            CREATE TABLE statistics (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                operation_type TEXT NOT NULL, count INTEGER DEFAULT 0, last_used DATETIME);
+            INSERT INTO calculations (expression, result, operation_type)
+                VALUES ('2+2', '4', 'add'), ('3+3', '6', 'add'), ('2*2', '4', 'multiply');
+            INSERT INTO statistics (operation_type, count) VALUES ('add', 1), ('add', 1);
+        ''')
+        conn.commit()
+        conn.close()
+        
+        db = CalculationHistory(path)
+        assert db.get_statistics()['stats'] == [('add', 2), ('multiply', 1)]
+        db.save_calculations([("5!", 120, 'factorial'), ("1+1", 2, 'add')])
+        stats = db.get_statistics()
+        assert stats['total_calculations'] == 5 and stats['operation_types'] == 3
+        with db.pool.connection() as conn:
+            conn.execute("DELETE FROM calculations WHERE operation_type = 'multiply'")
+        assert db.get_statistics()['stats'] == [('add', 3), ('factorial', 1)]
+        db.close()
+    
+    def test_keyset_pagination(self, tmp_path, monkeypatch):
+        """История читается страницами по before_id."""
+        db = CalculationHistory(str(tmp_path / "pages.db"))
+        db.save_calculations((f"{i}+0", i, 'add') for i in range(25))
+        ids = [row['id'] for row in db.iter_calculation_history(page_size=10)]
+        assert ids == list(range(25, 0, -1))
+        assert [row['id'] for row in db.get_calculation_history(3, before_id=10)] == [9, 8, 7]
+        
+        from church_calculator import church_web
+        monkeypatch.setattr(church_web, 'db', db)
+        monkeypatch.setattr(church_web, 'DATABASE_AVAILABLE', True)
+        client = church_web.app.test_client()
+        page = client.get('/history?limit=10').get_json()
+        assert page['next_before_id'] == 16
+        page = client.get(f"/history?limit=10&before_id={page['next_before_id']}").get_json()
+        assert page['history'][0]['id'] == 15
+        page = client.get('/history?limit=10&before_id=6').get_json()
+        assert len(page['history']) == 5 and page['next_before_id'] is None
+        db.close()
+    
+    def test_retention(self, tmp_path):
+        """Старые вычисления уходят в архив, итоги статистики не меняются."""
+        from datetime import datetime, timezone
+        db = CalculationHistory(str(tmp_path / "retention.db"))
+        with db.pool.connection() as conn:
+            conn.executemany(
+                "INSERT INTO calculations (expression, result, operation_type, timestamp) VALUES (?, ?, ?, ?)",
+                [("2+2", "4", 'add', "2026-01-01 10:00:00"),
+                 ("2*2", "4", 'multiply', "2026-01-01 11:00:00"),
+                 ("3+3", "6", 'add', "2026-01-02 10:00:00"),
+                 ("5!", "120", 'factorial', "2026-03-01 10:00:00")])
+        before = db.get_statistics()
+        
+        policy = RetentionPolicy(db, keep_days=30, archive_dir=str(tmp_path / "archive"))
+        report = policy.run(datetime(2026, 3, 10, tzinfo=timezone.utc))
+        assert report.archived == 3
+        assert [row['expression'] for row in read_archive(report.archive_path)] == ["2+2", "2*2", "3+3"]
+        assert [row['expression'] for row in db.get_calculation_history()] == ["5!"]
+        assert policy.daily_totals() == [("2026-01-01", 'add', 1), ("2026-01-01", 'multiply', 1),
+                                         ("2026-01-02", 'add', 1)]
+        assert db.get_statistics() == before
+        assert policy.run(datetime(2026, 3, 10, tzinfo=timezone.utc)).archived == 0
+        db.close()
+    
+    def test_retention_schedule(self, tmp_path):
+        """Ошибка прохода не мешает расписанию, stop останавливает его окончательно."""
+        db = CalculationHistory(str(tmp_path / "schedule.db"))
+        opened = len(db.pool)
+        
+        class FlakyPolicy(RetentionPolicy):
+            calls = 0
+            
+            def run(self, now=None):
+                FlakyPolicy.calls += 1
+                report = super().run(now)
+                if FlakyPolicy.calls == 1:
+                    raise RuntimeError("архив недоступен")
+                return report
+        
+        policy = FlakyPolicy(db, archive_dir=str(tmp_path / "archive"))
+        policy.start(0.01)
+        deadline = time.monotonic() + 5
+        while FlakyPolicy.calls < 3 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        policy.stop()
+        assert FlakyPolicy.calls >= 3
+        
+        # Идущий в момент stop проход завершается и больше не перезапускается
+        time.sleep(0.1)
+        calls = FlakyPolicy.calls
+        time.sleep(0.1)
+        assert FlakyPolicy.calls == calls
+        # Соединения потоков Timer закрыты, в том числе после ошибки
+        assert len(db.pool) == opened
+        db.close()
+    
+    def test_history_writer_batches(self, tmp_path):
+        """Отложенная запись собирает вычисления в пакеты."""
+        db = CalculationHistory(str(tmp_path / "writer.db"))
+        writer = HistoryWriter(db, batch_size=10, interval=60)
+        writer.submit_many((f"{i}+1", i + 1, 'add') for i in range(25))
+        writer.close()
+        stats = writer.stats()
+        assert stats['written'] == 25 and stats['batches'] == 3
+        assert db.get_statistics()['total_calculations'] == 25
+        assert not writer.submit("1+1", 2, 'add')
+        db.close()
+    
+    def test_change_notifications(self, tmp_path):
+        """Подписчики узнают о записи и очистке истории без опроса базы."""
+        db = CalculationHistory(str(tmp_path / "events.db"))
+        events = []
+        db.subscribe(lambda event, count: events.append((event, count)))
+        db.save_calculations([("1+1", 2, 'add'), ("2*3", 6, 'multiply')])
+        writer = HistoryWriter(db, interval=0.01)
+        writer.submit("2+2", 4, 'add')
+        writer.close()
+        db.clear_history()
+        assert events == [('insert', 2), ('insert', 1), ('clear', 0)]
+        db.close()
+    
+    def test_async_history(self, tmp_path):
+        """Асинхронный доступ к истории не блокирует цикл событий."""
+        import asyncio
+        db = CalculationHistory(str(tmp_path / "async.db"))
+        writer = HistoryWriter(db, interval=0.01)
+        history = AsyncHistory(db, writer)
+        
+        async def scenario():
+            results = await asyncio.gather(*(history.submit(f"{i}+1", i + 1, 'add')
+                                             for i in range(20)))
+            await asyncio.get_running_loop().run_in_executor(None, writer.flush)
+            return results, await history.get_calculation_history(5), await history.get_statistics()
+        
+        results, rows, stats = asyncio.run(scenario())
+        assert all(results)
+        assert len(rows) == 5 and stats['total_calculations'] == 20
+        history.close()
+        writer.close()
+        db.close()
+    
+    def test_async_endpoints(self, tmp_path, monkeypatch):
+        """Асинхронная версия отвечает по той же схеме JSON."""
+        pytest.importorskip('fastapi')
+        pytest.importorskip('httpx')
+        from fastapi.testclient import TestClient
+        monkeypatch.chdir(tmp_path)
+        from church_calculator import church_async
+        
+        with TestClient(church_async.app) as client:
+            data = client.post('/calculate', json={'expression': '2-5'}).json()
+            assert data['success'] and data['result'] == 0 and 'warning' in data
+            assert client.post('/calculate', json={'expression': '10^10^10'}).status_code == 422
+            assert client.get('/health').json()['status'] == 'healthy'
+            church_async.history_writer.flush()
+            page = client.get('/history', params={'limit': 1}).json()
+            assert page['history'][0]['expression'] == '2-5'
+    
+    def test_change_watcher(self, tmp_path):
+        """data_version сообщает о каждой фиксации другого соединения."""
+        path = str(tmp_path / "watch.db")
+        db = CalculationHistory(path)
+        watcher = ChangeWatcher(db)
+        assert not watcher.poll()
+        
+        # Фоновый поток записи пишет через своё соединение
+        writer = HistoryWriter(db, interval=0.01)
+        writer.submit("1+1", 2, 'add')
+        writer.close()
+        assert watcher.poll()
+        assert not watcher.poll()
+        
+        # Запись другого процесса сразу после своей тоже не теряется
+        other = CalculationHistory(path)
+        writer = HistoryWriter(db, interval=0.01)
+        writer.submit("2+2", 4, 'add')
+        writer.close()
+        other.save_calculation("5+5", 10, 'add')
+        assert watcher.poll()
+        assert not watcher.poll()
+        other.close()
+        db.close()
+    
+    def test_history_writer_interval_and_backpressure(self, tmp_path):
+        db = CalculationHistory(str(tmp_path / "writer.db"))
+        writer = HistoryWriter(db, interval=0.05)
+        writer.submit("1+1", 2, 'add')
+        time.sleep(0.5)
+        assert db.get_statistics()['total_calculations'] == 1
+        writer.close()
+        
+        db.close()
+        
+        # Медленный диск: запись пакета ждёт, очередь из двух мест переполняется
+        import threading
+        release = threading.Event()
+        
+        class SlowHistory:
+            def save_calculations(self, records):
+                release.wait()
+                return True
+        
+        slow = HistoryWriter(SlowHistory(), maxsize=2, batch_size=1, put_timeout=0.01)
+        accepted = [slow.submit(f"{i}+1", i + 1, 'add') for i in range(6)]
+        assert not all(accepted)
+        stats = slow.stats()
+        assert stats['blocked'] >= 1 and stats['dropped'] >= 1 and stats['high_water'] == 2
+        
+        # Срок ожидания общий для всего вызова, а не для каждой записи
+        start = time.monotonic()
+        assert not slow.submit_many((f"{i}*1", i, 'multiply') for i in range(50))
+        assert time.monotonic() - start < 1
+        assert slow.stats()['dropped'] == stats['dropped'] + 50
+        release.set()
+        slow.close()
+    
+    def test_history_writer_survives_errors(self):
+        """Исключение при записи пакета не останавливает поток и не вешает flush."""
+        class BrokenHistory:
+            def __init__(self):
+                self.calls = 0
+            
+            def save_calculations(self, records):
+                self.calls += 1
+                if self.calls == 1:
+                    raise RuntimeError("диск отключён")
+                return True
+        
+        writer = HistoryWriter(BrokenHistory(), interval=0.01)
+        writer.submit("1+1", 2, 'add')
+        writer.flush()
+        writer.submit("2+2", 4, 'add')
+        writer.flush()
+        stats = writer.stats()
+        assert stats['failed'] == 1 and stats['written'] == 1
+        writer.close()
+    
+    def test_connections_closed_with_threads(self, tmp_path):
+        """Соединение короткоживущего потока закрывается, когда поток завершается."""
+        import threading
+        db = CalculationHistory(str(tmp_path / "threads.db"))
+        db.save_calculation("2+2", 4, 'add')
+        opened = len(db.pool)
+        for _ in range(50):
+            thread = threading.Thread(target=db.find_result, args=("2+2", 'add'))
+            thread.start()
+            thread.join()
+        assert len(db.pool) == opened
+        db.close()
+        assert len(db.pool) == 0
+    
+    def test_database_path_from_environment(self, tmp_path, monkeypatch):
+        """Без явного пути история хранится в файле из CHURCH_DB_PATH."""
+        path = str(tmp_path / "env.db")
+        monkeypatch.setenv('CHURCH_DB_PATH', path)
+        db = CalculationHistory()
+        assert db.db_path == path
+        assert db.save_calculation("2+2", 4, 'add')
+        assert os.path.exists(path)
+        db.close()
+    
     def test_database_error_handling(self):
         """Тест обработки ошибок базы данных."""
         # Пытаемся создать базу данных в несуществующей папке
@@ -243,8 +1244,7 @@ class TestDatabase:
         finally:
             if os.path.exists(db_path):
                 try:
-                    if hasattr(db, '_conn'):
-                        db._conn.close()
+                    db.close()
                     time.sleep(0.1)
                     os.unlink(db_path)
                 except (PermissionError, OSError):
@@ -274,8 +1274,7 @@ class TestDatabase:
         finally:
             if os.path.exists(db_path):
                 try:
-                    if hasattr(db, '_conn'):
-                        db._conn.close()
+                    db.close()
                     time.sleep(0.1)
                     os.unlink(db_path)
                 except (PermissionError, OSError):